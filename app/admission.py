@@ -0,0 +1,183 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from utils.logger import setup_logger
+
+# Инициализация логгера
+logger = setup_logger("admission")
+
+# Полосы приоритета в порядке убывания: интерактивные письма обслуживаются раньше массовых
+LANES = ("interactive", "bulk")
+
+
+class AdmissionRejected(Exception):
+    """
+    Запрос отклонён контролем допуска (очередь полосы заполнена или ожидание истекло).
+
+    Attributes:
+        retry_after: Рекомендуемая пауза перед повтором, в секундах.
+        reason: Причина отказа: "queue_full", "timeout" или "deadline" (истёк бюджет времени запроса).
+    """
+
+    def __init__(self, retry_after: int, reason: str) -> None:
+        super().__init__(f"Запрос отклонён ({reason}), повторите через {retry_after} с.")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController:
+    """
+    Контроль допуска запросов к конвейеру генерации писем.
+
+    Одновременно выполняется не более max_in_flight конвейеров, остальные
+    запросы ждут в ограниченной очереди своей полосы. Освободившийся слот
+    получает самый старый запрос из полосы с наивысшим приоритетом. Запрос
+    отклоняется сразу, если очередь его полосы заполнена, и по истечении
+    max_wait секунд ожидания — так задержка допущенных запросов остаётся
+    ограниченной при перегрузке. Ограничения действуют в пределах процесса.
+
+    Attributes:
+        max_in_flight: Максимум одновременно выполняемых конвейеров (0 — без ограничения).
+        queue_sizes: Вместимость очереди по полосам.
+        max_wait: Максимальное время ожидания в очереди, в секундах.
+    """
+
+    def __init__(self, max_in_flight: int, queue_sizes: Dict[str, int], max_wait: float) -> None:
+        """
+        Создаёт контроллер без выполняющихся запросов.
+
+        Args:
+            max_in_flight: Максимум одновременно выполняемых конвейеров (0 — без ограничения).
+            queue_sizes: Вместимость очереди по полосам.
+            max_wait: Максимальное время ожидания в очереди, в секундах.
+        """
+        self.max_in_flight = max_in_flight
+        self.queue_sizes = queue_sizes
+        self.max_wait = max_wait
+        self._in_flight = 0
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        # Скользящее среднее длительности конвейера — для оценки Retry-After
+        self._service_seconds = 5.0
+        self._metrics: Dict[str, Dict[str, float]] = {
+            lane: {
+                "admitted": 0,
+                "shed_queue_full": 0,
+                "shed_timeout": 0,
+                "shed_deadline": 0,
+                "wait_seconds_total": 0.0,
+                "wait_seconds_max": 0.0,
+            }
+            for lane in LANES
+        }
+
+    def _queued(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def _retry_after(self) -> int:
+        """Оценка времени до освобождения слота для запроса в конце очереди."""
+        slots = max(self.max_in_flight, 1)
+        return max(1, math.ceil((self._queued() + 1) / slots * self._service_seconds))
+
+    def _admit(self, lane: str, wait_seconds: float) -> None:
+        stats = self._metrics[lane]
+        stats["admitted"] += 1
+        stats["wait_seconds_total"] += wait_seconds
+        stats["wait_seconds_max"] = max(stats["wait_seconds_max"], wait_seconds)
+
+    async def acquire(self, lane: str = "interactive", max_wait: Optional[float] = None) -> float:
+        """
+        Ожидает свободный слот для выполнения конвейера.
+
+        Args:
+            lane: Полоса приоритета запроса.
+            max_wait: Остаток бюджета времени запроса в секундах: ожидание
+                не дольше min(self.max_wait, max_wait).
+
+        Returns:
+            Момент допуска (time.monotonic()), передаётся в release().
+
+        Raises:
+            AdmissionRejected: Если очередь полосы заполнена или ожидание истекло.
+        """
+        start_time = time.monotonic()
+        if not self.max_in_flight or (self._in_flight < self.max_in_flight and not self._queued()):
+            self._in_flight += 1
+            self._admit(lane, 0.0)
+            return start_time
+
+        waiters = self._waiters[lane]
+        if len(waiters) >= self.queue_sizes[lane]:
+            self._metrics[lane]["shed_queue_full"] += 1
+            logger.debug("Очередь полосы '%s' заполнена, запрос отклонён.", lane)
+            raise AdmissionRejected(self._retry_after(), "queue_full")
+
+        # Ожидание ограничено и бюджетом времени запроса: слот после дедлайна бесполезен
+        timeout = self.max_wait if max_wait is None else min(self.max_wait, max_wait)
+        by_deadline = max_wait is not None and max_wait < self.max_wait
+
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=max(timeout, 0.0))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Слот передан одновременно с отменой — возвращаем его следующему
+                self._hand_over()
+            elif waiter in waiters:
+                waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError) and by_deadline:
+                self._metrics[lane]["shed_deadline"] += 1
+                logger.debug("Бюджет времени запроса в полосе '%s' истёк в очереди.", lane)
+                raise AdmissionRejected(self._retry_after(), "deadline") from None
+            if isinstance(e, asyncio.TimeoutError):
+                self._metrics[lane]["shed_timeout"] += 1
+                logger.debug("Ожидание в полосе '%s' превысило %.1f с, запрос отклонён.", lane, self.max_wait)
+                raise AdmissionRejected(self._retry_after(), "timeout") from None
+            raise
+
+        admitted_at = time.monotonic()
+        self._admit(lane, admitted_at - start_time)
+        return admitted_at
+
+    def release(self, admitted_at: float) -> None:
+        """
+        Освобождает слот и передаёт его следующему запросу по приоритету.
+
+        Args:
+            admitted_at: Момент допуска, возвращённый acquire().
+        """
+        elapsed = time.monotonic() - admitted_at
+        self._service_seconds = 0.9 * self._service_seconds + 0.1 * elapsed
+        self._hand_over()
+
+    def _hand_over(self) -> None:
+        """Передаёт освободившийся слот первому ожидающему запросу по приоритету."""
+        for lane in LANES:
+            waiters = self._waiters[lane]
+            while waiters:
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    # Слот переходит ожидающему запросу, счётчик не меняется
+                    waiter.set_result(None)
+                    return
+        self._in_flight -= 1
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Возвращает метрики контроля допуска для экспорта.
+
+        Returns:
+            Словарь с числом выполняющихся запросов и метриками по полосам.
+        """
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self._in_flight,
+            "service_seconds_avg": round(self._service_seconds, 3),
+            "lanes": {
+                lane: {**stats, "queue_depth": len(self._waiters[lane]), "queue_size": self.queue_sizes[lane]}
+                for lane, stats in self._metrics.items()
+            },
+        }
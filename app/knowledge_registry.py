@@ -0,0 +1,306 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from app.retrieval import rebuild_knowledge_base
+from app.shards import spawn_local_shards
+from data_ingestion.ann_index import ann_index_path, load_ann_index
+from data_ingestion.config import ANN_INDEX_ENABLED, TENANT_DATA_DIR
+from utils.chroma_client import collection_name_for, get_chroma_client
+from utils.collection_aliases import resolve_alias
+from utils.logger import setup_logger
+from utils.vector_index import InMemoryIndex
+
+# Инициализация логгера
+logger = setup_logger("knowledge_registry")
+
+DEFAULT_KNOWLEDGE_BASE = "default"
+
+# Пауза перед остановкой серверов шардов вытесненной базы: текущие запросы успевают завершиться
+RETIRE_GRACE_SECONDS = 30.0
+
+
+def load_knowledge_base_index(knowledge_base_id: Optional[str]):
+    """
+    Загружает резидентный индекс базы знаний, строя базу при необходимости.
+
+    Args:
+        knowledge_base_id: Идентификатор базы знаний (None — основная база).
+
+    Returns:
+        Индекс базы: ShardedIndex (база разбита на шарды), IVFInt8Index или InMemoryIndex.
+    """
+    alias = collection_name_for(knowledge_base_id)
+    collection = get_chroma_client().get_or_create_collection(resolve_alias(alias))
+    if collection.count() == 0:
+        logger.warning(f"🔄 Коллекция '{alias}' пуста. Запускаю пересборку базы...")
+        rebuild_knowledge_base(knowledge_base_id)
+        collection = get_chroma_client().get_or_create_collection(resolve_alias(alias))
+
+    # Шардированная база обслуживается серверами шардов в отдельных процессах
+    sharded = spawn_local_shards(collection.name)
+    if sharded is not None:
+        return sharded
+
+    if ANN_INDEX_ENABLED:
+        return load_ann_index(collection.name)
+    return InMemoryIndex.from_collection(collection)
+
+
+class KnowledgeBaseRegistry:
+    """
+    Реестр резидентных индексов баз знаний с ленивой загрузкой и LRU-вытеснением.
+
+    Индекс базы загружается при первом обращении. Если суммарный объём
+    резидентных индексов превышает бюджет, вытесняются давно не использованные
+    базы (последняя загруженная база не вытесняется никогда).
+
+    Когда псевдоним базы переключается на новую версию коллекции, новая версия
+    загружается в фоне, а до её готовности запросы обслуживает текущий индекс.
+    В многопроцессном режиме (serve.py) базы, загруженные мастером до fork
+    (master_keys), воркеры не перезагружают: новую версию загружает мастер
+    через refresh_swapped() и перезапускает воркеры, чтобы они унаследовали
+    её через fork. Базы, загруженные самим воркером, обновляются в фоне.
+
+    Attributes:
+        memory_budget_bytes: Бюджет памяти на резидентные индексы.
+        master_keys: Базы, новые версии которых загружает мастер serve.py.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[Optional[str]], Any] = load_knowledge_base_index,
+        memory_budget_bytes: int = 1024 * 1024**2,
+    ) -> None:
+        """
+        Создаёт пустой реестр.
+
+        Args:
+            loader: Функция загрузки индекса по идентификатору базы.
+            memory_budget_bytes: Бюджет памяти на резидентные индексы.
+        """
+        self.memory_budget_bytes = memory_budget_bytes
+        self.master_keys: frozenset = frozenset()
+        self._loader = loader
+        self._indexes: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._metrics: Dict[str, Dict[str, float]] = {}
+        self._refreshing: set = set()
+
+    @staticmethod
+    def _key(knowledge_base_id: Optional[str]) -> str:
+        return knowledge_base_id or DEFAULT_KNOWLEDGE_BASE
+
+    @staticmethod
+    def _knowledge_base_id(key: str) -> Optional[str]:
+        return None if key == DEFAULT_KNOWLEDGE_BASE else key
+
+    def _stats(self, key: str) -> Dict[str, float]:
+        return self._metrics.setdefault(
+            key, {"hits": 0, "loads": 0, "evictions": 0, "load_seconds_total": 0.0, "last_load_seconds": 0.0}
+        )
+
+    def exists(self, knowledge_base_id: Optional[str]) -> bool:
+        """
+        Проверяет, что база знаний известна (резидентна или для неё есть данные).
+
+        Args:
+            knowledge_base_id: Идентификатор базы знаний.
+
+        Returns:
+            True, если базу можно загрузить.
+        """
+        if knowledge_base_id == DEFAULT_KNOWLEDGE_BASE:
+            # Ключ основной базы не может быть идентификатором базы продуктовой линии
+            return False
+        if not knowledge_base_id or self._key(knowledge_base_id) in self._indexes:
+            return True
+        return (TENANT_DATA_DIR / knowledge_base_id).is_dir() or (
+            ann_index_path(collection_name_for(knowledge_base_id)) / "meta.json"
+        ).exists()
+
+    def get(self, knowledge_base_id: Optional[str] = None):
+        """
+        Возвращает индекс базы знаний, загружая его при первом обращении.
+
+        Args:
+            knowledge_base_id: Идентификатор базы знаний (None — основная база).
+
+        Returns:
+            Индекс с интерфейсом count/query.
+        """
+        key = self._key(knowledge_base_id)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                self._stats(key)["hits"] += 1
+                self._refresh_if_swapped(knowledge_base_id, key, index)
+                return index
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Загрузка вне общей блокировки: обращения к другим базам не ждут
+        with load_lock:
+            with self._lock:
+                index = self._indexes.get(key)
+                if index is not None:
+                    self._stats(key)["hits"] += 1
+                    return index
+
+            start_time = time.perf_counter()
+            index = self._loader(knowledge_base_id)
+            elapsed = time.perf_counter() - start_time
+
+            with self._lock:
+                self._indexes[key] = index
+                stats = self._stats(key)
+                stats["loads"] += 1
+                stats["load_seconds_total"] += elapsed
+                stats["last_load_seconds"] = elapsed
+                self._evict()
+
+        logger.info("База знаний '%s' загружена за %.2f секунд (%d байт).", key, elapsed, getattr(index, "nbytes", 0))
+        return index
+
+    async def aget(self, knowledge_base_id: Optional[str] = None):
+        """
+        Асинхронный вариант get для обработчиков запросов.
+
+        Резидентный индекс возвращается сразу, а загрузка холодной базы (снимок,
+        пересборка коллекции, запуск серверов шардов) выполняется в пуле потоков
+        и не блокирует event loop для остальных запросов.
+
+        Args:
+            knowledge_base_id: Идентификатор базы знаний (None — основная база).
+
+        Returns:
+            Индекс с интерфейсом count/query.
+        """
+        with self._lock:
+            resident = self._key(knowledge_base_id) in self._indexes
+        if resident:
+            return self.get(knowledge_base_id)
+        return await asyncio.to_thread(self.get, knowledge_base_id)
+
+    def _refresh_if_swapped(self, knowledge_base_id: Optional[str], key: str, index) -> None:
+        """Запускает фоновую загрузку, если псевдоним указывает на другую версию (под self._lock)."""
+        name = getattr(index, "name", None)
+        if name is None or key in self.master_keys or key in self._refreshing:
+            return
+        if resolve_alias(collection_name_for(knowledge_base_id)) == name:
+            return
+
+        self._refreshing.add(key)
+        threading.Thread(target=self._reload, args=(knowledge_base_id, key), daemon=True).start()
+
+    def _reload(self, knowledge_base_id: Optional[str], key: str) -> bool:
+        """Загружает новую версию базы и подменяет ею резидентный индекс (True — успешно)."""
+        try:
+            start_time = time.perf_counter()
+            index = self._loader(knowledge_base_id)
+            elapsed = time.perf_counter() - start_time
+            with self._lock:
+                stats = self._stats(key)
+                stats["loads"] += 1
+                stats["load_seconds_total"] += elapsed
+                stats["last_load_seconds"] = elapsed
+            self.put(knowledge_base_id, index)
+            logger.info("База знаний '%s' переключена на версию '%s'.", key, getattr(index, "name", None))
+            return True
+        except Exception as e:
+            logger.error("Ошибка при загрузке новой версии базы '%s': %s", key, e)
+            return False
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def resident_keys(self) -> List[str]:
+        """Ключи резидентных баз знаний."""
+        with self._lock:
+            return list(self._indexes)
+
+    def refresh_swapped(self) -> List[str]:
+        """
+        Синхронно загружает новые версии резидентных баз, псевдонимы которых переключены.
+
+        Используется мастером serve.py: новая версия загружается один раз
+        (в том числе запускаются её серверы шардов), после чего мастер
+        перезапускает воркеры.
+
+        Returns:
+            Ключи баз, переключённых на новую версию.
+        """
+        with self._lock:
+            swapped = [
+                key
+                for key, index in self._indexes.items()
+                if getattr(index, "name", None) is not None
+                and resolve_alias(collection_name_for(self._knowledge_base_id(key))) != index.name
+            ]
+
+        reloaded = []
+        for key in swapped:
+            with self._lock:
+                if key in self._refreshing:
+                    continue
+                self._refreshing.add(key)
+            if self._reload(self._knowledge_base_id(key), key):
+                reloaded.append(key)
+        return reloaded
+
+    def put(self, knowledge_base_id: Optional[str], index) -> None:
+        """Регистрирует уже загруженный индекс базы знаний."""
+        key = self._key(knowledge_base_id)
+        with self._lock:
+            previous = self._indexes.get(key)
+            self._indexes[key] = index
+            self._indexes.move_to_end(key)
+            self._evict()
+        if previous is not None and previous is not index:
+            self._retire(previous)
+
+    def resident_bytes(self) -> int:
+        """Суммарный объём резидентных индексов в байтах."""
+        return int(sum(getattr(index, "nbytes", 0) for index in self._indexes.values()))
+
+    def _evict(self) -> None:
+        """Вытесняет давно не использованные базы сверх бюджета (под self._lock)."""
+        while len(self._indexes) > 1 and self.resident_bytes() > self.memory_budget_bytes:
+            key, index = self._indexes.popitem(last=False)
+            self._stats(key)["evictions"] += 1
+            self._retire(index)
+            logger.info("База знаний '%s' вытеснена из памяти.", key)
+
+    @staticmethod
+    def _retire(index) -> None:
+        """Освобождает ресурсы индекса (серверы шардов) после завершения текущих запросов."""
+        close = getattr(index, "close", None)
+        if close is not None:
+            timer = threading.Timer(RETIRE_GRACE_SECONDS, close)
+            timer.daemon = True
+            timer.start()
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Возвращает метрики реестра для экспорта.
+
+        Returns:
+            Словарь с бюджетом, резидентным объёмом и метриками по базам.
+        """
+        with self._lock:
+            knowledge_bases = {}
+            for key, stats in self._metrics.items():
+                index = self._indexes.get(key)
+                knowledge_bases[key] = {
+                    **stats,
+                    "resident": index is not None,
+                    "resident_bytes": getattr(index, "nbytes", 0) if index is not None else 0,
+                }
+            return {
+                "budget_bytes": self.memory_budget_bytes,
+                "resident_bytes": self.resident_bytes(),
+                "knowledge_bases": knowledge_bases,
+            }
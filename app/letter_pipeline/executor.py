@@ -0,0 +1,71 @@
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.logger import setup_logger
+
+# Инициализация логгера
+logger = setup_logger("letter_pipeline")
+
+# Узел конвейера: принимает состояние и возвращает только изменённые ключи
+Node = Callable[[dict], Awaitable[Optional[dict]]]
+
+
+class LinearPipeline:
+    """
+    Последовательный исполнитель линейного конвейера без LangGraph.
+
+    Выполняет те же узлы, что и граф, над одним изменяемым словарём
+    состояния: обновления узла применяются через dict.update, без копий
+    состояния между узлами и без каналов LangGraph. Время каждого узла
+    накапливается в метриках.
+
+    Attributes:
+        steps: Узлы конвейера в порядке выполнения (имя, функция).
+    """
+
+    def __init__(self, steps: List[Tuple[str, Node]]) -> None:
+        """
+        Создаёт исполнитель для заданной цепочки узлов.
+
+        Args:
+            steps: Узлы конвейера в порядке выполнения (имя, функция).
+        """
+        self.steps = steps
+        self._metrics: Dict[str, Dict[str, float]] = {
+            name: {"calls": 0, "seconds_total": 0.0, "seconds_max": 0.0} for name, _ in steps
+        }
+
+    async def ainvoke(self, state: dict) -> dict:
+        """
+        Выполняет конвейер (интерфейс совместим с chain.ainvoke LangGraph).
+
+        Args:
+            state: Начальное состояние конвейера (не изменяется).
+
+        Returns:
+            Итоговое состояние конвейера.
+        """
+        state = dict(state)
+        for name, node in self.steps:
+            start_time = time.perf_counter()
+            update = await node(state)
+            elapsed = time.perf_counter() - start_time
+            if update:
+                state.update(update)
+
+            stats = self._metrics[name]
+            stats["calls"] += 1
+            stats["seconds_total"] += elapsed
+            if elapsed > stats["seconds_max"]:
+                stats["seconds_max"] = elapsed
+            logger.debug("Узел '%s' выполнен за %.4f секунд.", name, elapsed)
+        return state
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Возвращает накопленное время выполнения узлов.
+
+        Returns:
+            Словарь с метриками по узлам.
+        """
+        return {"executor": "linear", "nodes": {name: dict(stats) for name, stats in self._metrics.items()}}
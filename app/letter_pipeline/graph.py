@@ -4,9 +4,11 @@ from langgraph.graph import StateGraph
 import nltk
 nltk.download('punkt')
 
+from app.letter_pipeline.executor import LinearPipeline
 from app.letter_pipeline.nodes import input_node, search_chunks_node, build_prompt_node, generate_letter_node, \
     output_node
 from app.letter_pipeline.types import LetterState
+from data_ingestion.config import PIPELINE_EXECUTOR
 graph = StateGraph(LetterState)
 
 """
@@ -36,10 +38,30 @@ graph.add_edge("generate", "output")
 graph.set_finish_point("output")
 
 # Компиляция графа в исполняемый конвейер
-chain = graph.compile()
+graph_chain = graph.compile()
+
+# Тот же конвейер без LangGraph: узлы по порядку над одним словарём состояния
+linear_chain = LinearPipeline(
+    [
+        ("input", input_node),
+        ("search", search_chunks_node),
+        ("prompt", build_prompt_node),
+        ("generate", generate_letter_node),
+        ("output", output_node),
+    ]
+)
+
+chain = linear_chain if PIPELINE_EXECUTOR == "linear" else graph_chain
 """
-Скомпилированный конвейер для генерации письма.
+Конвейер для генерации письма (исполнитель выбирается PIPELINE_EXECUTOR).
 
 Обрабатывает пользовательский ввод, выполняет поиск чанков, формирует промпт,
 генерирует письмо и возвращает результат.
 """
+
+
+def pipeline_metrics() -> dict:
+    """Возвращает метрики исполнителя конвейера (время узлов — только для linear)."""
+    if chain is linear_chain:
+        return linear_chain.metrics()
+    return {"executor": "langgraph"}
@@ -1,45 +1,72 @@
 
+import asyncio
 import os
 import time
-from typing import Dict
+from typing import Any, Dict, List, Optional
 
-import psutil
+from openai import APITimeoutError
 from sentence_transformers import SentenceTransformer
 
 from app.helpers import extract_json
 from app.letter_pipeline.openai_client import client
 from app.letter_pipeline.types import LetterState
-from app.retrieval import find_relevant_chunks_by_segment
-from data_ingestion.config import CHROMA_COLLECTION_NAME, EMBEDDING_MODEL_NAME
-from utils.chroma_client import get_chroma_client
-from utils.logger import setup_logger
+from app.knowledge_registry import KnowledgeBaseRegistry
+from app.retrieval import ChunkCache, afind_relevant_chunks_by_segment
+from data_ingestion.config import (
+    EMBEDDING_MODEL_NAME,
+    KB_MEMORY_BUDGET_MB,
+    PRELOAD_KNOWLEDGE_BASES,
+    RETRIEVAL_BUDGET_SHARE,
+    RETRIEVAL_CACHE_SIZE,
+    DEADLINE_MIN_LLM_SECONDS,
+)
+from utils.logger import RSS_MB, setup_logger
 
 # Инициализация логгера
 logger = setup_logger("letter_pipeline")
 
-# Глобальная инициализация клиента ChromaDB и модели эмбеддингов
-chroma_client = get_chroma_client()
-chroma_collection = chroma_client.get_or_create_collection(CHROMA_COLLECTION_NAME)
+# Глобальная инициализация реестра баз знаний и модели эмбеддингов
+knowledge_registry = KnowledgeBaseRegistry(memory_budget_bytes=KB_MEMORY_BUDGET_MB * 1024**2)
+
+# Основная база (и базы из PRELOAD_KNOWLEDGE_BASES) загружаются при старте
+for knowledge_base_id in [None, *PRELOAD_KNOWLEDGE_BASES]:
+    knowledge_registry.get(knowledge_base_id)
 embedder = SentenceTransformer(EMBEDDING_MODEL_NAME)
 openai_client = client
 PROMPT_PATH = os.path.join(os.path.dirname(__file__), "prompt_template.txt")
 
+# Последние результаты поиска: ответ без поиска, когда на него не хватает времени
+chunk_cache = ChunkCache(RETRIEVAL_CACHE_SIZE)
+
+
+def remaining_seconds(state: LetterState) -> Optional[float]:
+    """Остаток бюджета времени запроса в секундах (None — дедлайн не задан)."""
+    deadline = state.get("deadline")
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def degrade(state: LetterState, stage: str) -> list:
+    """Возвращает список деградировавших этапов с добавленным этапом stage."""
+    return [*state.get("degraded", []), stage]
+
 # Определение узлов конвейера
-async def input_node(state: LetterState) -> LetterState:
+# Узлы возвращают только изменённые ключи состояния: LangGraph и LinearPipeline
+# применяют обновление сами, без копирования всего состояния на каждом шаге
+async def input_node(state: LetterState) -> Dict[str, Any]:
     """
-    Принимает начальное состояние и возвращает его без изменений.
+    Принимает начальное состояние без изменений.
 
     Args:
         state: Состояние конвейера с пользовательскими данными.
 
     Returns:
-        То же состояние без изменений.
+        Пустое обновление состояния.
     """
-    # Возврат входного состояния
-    return state
+    # Входное состояние не изменяется
+    return {}
 
 
-async def search_chunks_node(state: LetterState) -> LetterState:
+async def search_chunks_node(state: LetterState) -> Dict[str, Any]:
     """
     Выполняет семантический поиск релевантных чанков по сегменту.
 
@@ -47,32 +74,62 @@ async def search_chunks_node(state: LetterState) -> LetterState:
         state: Состояние конвейера с пользовательскими данными.
 
     Returns:
-        Обновленное состояние с добавленным списком чанков.
+        Обновление состояния со списком чанков.
     """
     # Проверка наличия и корректности сегмента
     if not isinstance(state.get("user_input"), Dict) or not state["user_input"].get("сегмент"):
         logger.error("Отсутствует или некорректен ключ 'сегмент' в user_input.")
-        return {**state, "chunks": []}
+        return {"chunks": []}
 
-    # Извлечение сегмента и поиск чанков
+    # Извлечение сегмента, выбор базы знаний и поиск чанков
     segment = state["user_input"]["сегмент"]
-    chunks = find_relevant_chunks_by_segment(segment, chroma_collection, embedder)
+    knowledge_base_id = state["user_input"].get("база_знаний")
+
+    # При дедлайне поиск получает долю остатка бюджета, остальное — генерации письма
+    remaining = remaining_seconds(state)
+    if remaining is not None and remaining <= 0:
+        return search_fallback(state, knowledge_base_id, segment)
+
+    # Загрузка холодной базы входит в бюджет поиска: при нехватке времени — чанки из кэша
+    try:
+        search = search_knowledge_base(knowledge_base_id, segment)
+        if remaining is None:
+            chunks = await search
+        else:
+            chunks = await asyncio.wait_for(search, timeout=remaining * RETRIEVAL_BUDGET_SHARE)
+    except asyncio.TimeoutError:
+        return search_fallback(state, knowledge_base_id, segment)
+    except Exception as e:
+        logger.error("Не удалось загрузить базу знаний: %s", e)
+        return {"chunks": []}
+    if chunks:
+        chunk_cache.put(knowledge_base_id, segment, chunks)
 
     # Логирование потребления памяти
-    logger.info(
-        f"Потребление памяти после поиска чанков: "
-        f"{psutil.Process().memory_info().rss / 1024**2:.2f} МБ"
-    )
+    logger.info("Потребление памяти после поиска чанков: %s МБ", RSS_MB)
 
     # Обновление состояния с найденными чанками
-    return {**state, "chunks": chunks}
+    return {"chunks": chunks}
+
+async def search_knowledge_base(knowledge_base_id: Optional[str], segment: str) -> List[str]:
+    """Загружает базу знаний (при первом обращении) и ищет в ней чанки по сегменту."""
+    collection = await knowledge_registry.aget(knowledge_base_id)
+    return await afind_relevant_chunks_by_segment(segment, collection, embedder)
+
+
+def search_fallback(state: LetterState, knowledge_base_id: Optional[str], segment: str) -> Dict[str, Any]:
+    """Обновление состояния с сохранёнными чанками, когда на поиск не хватило времени."""
+    chunks, source = chunk_cache.get(knowledge_base_id, segment)
+    logger.warning("Поиск чанков не уложился в бюджет времени, используются чанки: %s.", source or "нет")
+    return {"chunks": chunks, "degraded": degrade(state, "search")}
+
 
 def load_prompt_template() -> str:
     """Загружает контекстный промпт по указанному пути"""
     with open(PROMPT_PATH, "r", encoding="utf-8") as f:
         return f.read()
 
-async def build_prompt_node(state: LetterState) -> LetterState:
+async def build_prompt_node(state: LetterState) -> Dict[str, Any]:
     """
     Формирует промпт для генерации письма на основе пользовательских данных и чанков.
 
@@ -80,12 +137,12 @@ async def build_prompt_node(state: LetterState) -> LetterState:
         state: Состояние конвейера с пользовательскими данными и чанками.
 
     Returns:
-        Обновленное состояние с добавленным промптом.
+        Обновление состояния с промптом.
     """
     # Проверка наличия необходимых данных
     if not isinstance(state.get("user_input"), Dict) or not state.get("chunks"):
         logger.error("Отсутствуют необходимые данные: user_input или chunks.")
-        return {**state, "prompt": ""}
+        return {"prompt": ""}
 
     user_input = state["user_input"]
     chunks = state["chunks"]
@@ -93,47 +150,84 @@ async def build_prompt_node(state: LetterState) -> LetterState:
     required_keys = ["контакт", "должность", "название_компании", "сегмент"]
     missing_keys = [key for key in required_keys if key not in user_input]
     if missing_keys:
-        logger.error(f"Отсутствуют ключи в user_input: {missing_keys}")
-        return {**state, "prompt": ""}
+        logger.error("Отсутствуют ключи в user_input: %s", missing_keys)
+        return {"prompt": ""}
 
     # Формирование контекста из чанков (ограничение до 5)
     context = "\n\n".join(chunks[:5])
 
     # Создание промпта для письма
-    print("template keys:", user_input.keys())
     template = load_prompt_template()
 
     try:
         prompt = template.format(**user_input, context=context)
     except KeyError as e:
-        logger.error(f"Ошибка форматирования шаблона: отсутствует ключ {e}")
-        return {**state, "prompt": ""}
+        logger.error("Ошибка форматирования шаблона: отсутствует ключ %s", e)
+        return {"prompt": ""}
 
     # Обновление состояния с промптом
-    return {**state, "prompt": prompt}
+    return {"prompt": prompt}
 
 
-async def generate_letter_node(state: LetterState) -> LetterState:
+def parse_letter(letter_raw: str) -> Dict[str, str]:
+    """
+    Разбирает ответ модели в тему и текст письма.
+
+    Args:
+        letter_raw: Текст ответа модели (JSON с ключами subject и body).
+
+    Returns:
+        Словарь с ключами subject и letter.
+    """
+    try:
+        letter_json = extract_json(letter_raw)
+        subject = letter_json.get("subject", "")
+        body = letter_json.get("body", "")
+    except Exception as e:
+        logger.warning("Ошибка парсинга JSON-ответа: %s", e)
+        subject = ""
+        body = letter_raw  # fallback
+    return {"subject": subject, "letter": body}
+
+
+async def generate_letter_node(state: LetterState) -> Dict[str, Any]:
     """
     Генерирует деловое письмо с помощью OpenAI API на основе промпта.
 
+    Несколько вариантов письма запрашиваются одним вызовом (параметр n):
+    промпт отправляется и тарифицируется один раз, а время генерации
+    близко ко времени одного письма. Каждый вариант разбирается отдельно,
+    неразобранные варианты отбрасываются.
+
+    При дедлайне таймаут вызова равен остатку бюджета (без повторных попыток),
+    а если остаток меньше DEADLINE_MIN_LLM_SECONDS, модель не вызывается.
+
     Args:
-        state: Состояние конвейера с промптом.
+        state: Состояние конвейера с промптом и числом вариантов.
 
     Returns:
-        Обновленное состояние с сгенерированным письмом.
+        Обновление состояния с сгенерированным письмом и его вариантами.
     """
     # Проверка наличия промпта
     if not state.get("prompt"):
         logger.error("Отсутствует промпт для генерации письма.")
-        return {**state, "letter": ""}
+        return {"letter": "", "letters": []}
+
+    variants = state.get("variants") or 1
+
+    # Проверка остатка бюджета времени
+    remaining = remaining_seconds(state)
+    if remaining is not None and remaining < DEADLINE_MIN_LLM_SECONDS:
+        logger.warning("Недостаточно времени для генерации письма: осталось %.2f секунд.", remaining)
+        return {"subject": "", "letter": "", "letters": [], "degraded": degrade(state, "generate")}
+    llm_client = openai_client if remaining is None else openai_client.with_options(timeout=remaining, max_retries=0)
 
     # Генерация письма через асинхронный OpenAI API
     try:
         start_time = time.perf_counter()
 
-        logger.info("Отправляем запрос в OpenAI API")
-        response = await openai_client.chat.completions.create(
+        logger.info("Отправляем запрос в OpenAI API (вариантов: %d)", variants)
+        request = llm_client.chat.completions.create(
             model="gpt-4o",
             messages=[
                 {
@@ -143,55 +237,54 @@ async def generate_letter_node(state: LetterState) -> LetterState:
                 {"role": "user", "content": state["prompt"]},
             ],
             temperature=0.7,
+            n=variants,
         )
-        letter_raw = response.choices[0].message.content
+        response = await (request if remaining is None else asyncio.wait_for(request, timeout=remaining))
         elapsed = time.perf_counter() - start_time
 
         # Логгирование времени генерации
-        logger.info(f"📨 Письмо успешно сгенерировано за {elapsed:.2f} секунд.")
+        logger.info("📨 Письмо успешно сгенерировано за %.2f секунд.", elapsed)
 
-        try:
-            letter_json = extract_json(letter_raw)
-            subject = letter_json.get("subject", "")
-            body = letter_json.get("body", "")
-        except Exception as e:
-            logger.warning(f"Ошибка парсинга JSON-ответа: {e}")
-            subject = ""
-            body = letter_raw  # fallback
+        # Разбор каждого варианта независимо: частичный результат лучше пустого
+        letters = [parse_letter(choice.message.content) for choice in response.choices]
+        letters = [letter for letter in letters if letter["subject"] and letter["letter"]]
+        if len(letters) < variants:
+            logger.warning("Разобрано вариантов письма: %d из %d.", len(letters), variants)
 
         # Логирование потребления памяти
-        logger.info(
-            f"Потребление памяти после генерации письма: "
-            f"{psutil.Process().memory_info().rss / 1024**2:.2f} МБ"
-        )
+        logger.info("Потребление памяти после генерации письма: %s МБ", RSS_MB)
 
-        # Обновление состояния с сгенерированным письмом
-        return {**state, "subject": subject, "letter": body}
+        # Обновление состояния: первый вариант — основное письмо
+        first = letters[0] if letters else {"subject": "", "letter": ""}
+        return {"subject": first["subject"], "letter": first["letter"], "letters": letters}
 
     except Exception as e:
-        logger.error(f"Ошибка при генерации письма: {e}")
-        return {**state, "subject": "", "letter": ""}
+        if remaining is not None and isinstance(e, (asyncio.TimeoutError, APITimeoutError)):
+            logger.warning("Генерация письма не уложилась в бюджет времени: %s", e)
+            return {"subject": "", "letter": "", "letters": [], "degraded": degrade(state, "generate")}
+        logger.error("Ошибка при генерации письма: %s", e)
+        return {"subject": "", "letter": "", "letters": []}
 
 
-async def output_node(state: LetterState) -> LetterState:
+async def output_node(state: LetterState) -> Dict[str, Any]:
     """
-    Возвращает состояние с сгенерированным письмом.
+    Проверяет итоговое письмо в состоянии.
 
     Args:
         state: Состояние конвейера с письмом.
 
     Returns:
-        Состояние с письмом (для совместимости с LangGraph).
+        Пустое обновление или сброс темы и письма, если одно из них отсутствует.
     """
     # Проверка наличия темы
     if not state.get("subject"):
         logger.warning("Тема письма отсутствует в состоянии.")
-        return {**state, "subject": "", "letter": ""}
+        return {"subject": "", "letter": ""}
 
     # Проверка наличия письма
     if not state.get("letter"):
         logger.warning("Письмо отсутствует в состоянии.")
-        return {**state, "subject": "", "letter": ""}
+        return {"subject": "", "letter": ""}
 
-    # Возврат состояния для совместимости с LangGraph
-    return state
+    # Письмо готово, состояние не изменяется
+    return {}
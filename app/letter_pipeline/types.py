@@ -1,4 +1,4 @@
-from typing import TypedDict, List
+from typing import Dict, List, Optional, TypedDict
 
 
 class LetterState(TypedDict):
@@ -7,11 +7,20 @@ class LetterState(TypedDict):
 
     Attributes:
         user_input: Словарь с пользовательскими данными (контакт, должность, компания, сегмент).
+        variants: Количество вариантов письма по одному промпту.
+        deadline: Момент (time.monotonic()), к которому запрос должен завершиться; None — без дедлайна.
+        degraded: Этапы, выполненные в упрощённом режиме из-за нехватки времени.
         chunks: Список релевантных чанков из базы знаний.
         prompt: Промпт для генерации письма.
-        letter: Сгенерированное письмо."""
+        subject: Тема первого варианта письма.
+        letter: Сгенерированное письмо (первый вариант).
+        letters: Успешно разобранные варианты письма (subject, letter)."""
     user_input: dict
+    variants: int
+    deadline: Optional[float]
+    degraded: List[str]
     chunks: List[str]
     prompt: str
     subject: str
     letter: str
+    letters: List[Dict[str, str]]
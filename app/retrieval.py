@@ -1,14 +1,23 @@
+import asyncio
+import heapq
 import os
 import warnings
-from typing import List
+from collections import OrderedDict
+from operator import itemgetter
+from typing import Dict, List, Optional, Sequence, Tuple
 
 from chromadb.api.models import Collection
 from sentence_transformers import SentenceTransformer
 
-from data_ingestion.config import RAW_DATA_DIR, PROCESSED_DATA_DIR, CHROMA_COLLECTION_NAME, ZIP_PATH
+from data_ingestion.config import (
+    RAW_DATA_DIR,
+    PROCESSED_DATA_DIR,
+    ZIP_PATH,
+    TENANT_DATA_DIR,
+    SHARD_TIMEOUT_MS,
+)
 from data_ingestion.extractor import extract_nested_zip
 from data_ingestion.ingestor import KnowledgeBaseBuilder
-from utils.chroma_client import get_chroma_client
 from utils.logger import setup_logger
 
 # Игнорирование предупреждения torch
@@ -21,6 +30,40 @@ warnings.filterwarnings(
 # Инициализация логгера
 logger = setup_logger("chunks")
 
+def rebuild_knowledge_base(knowledge_base_id: Optional[str] = None) -> bool:
+    """
+    Распаковывает архив со статьями и заново строит базу знаний.
+
+    Args:
+        knowledge_base_id: Идентификатор базы знаний продуктовой линии.
+            Для таких баз документы уже лежат в data/tenants/<id>, распаковка не нужна.
+
+    Returns:
+        True, если база построена, False, если исходные данные не найдены.
+    """
+    # Шаг 1: Распаковка архива
+    if knowledge_base_id:
+        if not (TENANT_DATA_DIR / knowledge_base_id).is_dir():
+            logger.error(f"❌ Документы базы знаний '{knowledge_base_id}' не найдены.")
+            return False
+    elif os.path.exists(RAW_DATA_DIR):
+        logger.info("Начинаю распаковку архива")
+        try:
+            extract_nested_zip(ZIP_PATH, PROCESSED_DATA_DIR)
+        except Exception as e:
+            logger.error(f"Не удалось распаковать архив {e}")
+        logger.info("📦 Архив успешно распакован.")
+    else:
+        logger.error(f"❌ Архив не найден по пути: {RAW_DATA_DIR}")
+        return False
+
+    # Шаг 2: Построение базы знаний
+    builder = KnowledgeBaseBuilder(knowledge_base_id)
+    builder.ingest()
+    logger.info("✅ База знаний успешно создана.")
+    return True
+
+
 def find_relevant_chunks_by_segment(
     segment: str,
     collection: Collection,
@@ -44,42 +87,152 @@ def find_relevant_chunks_by_segment(
         logger.warning("Пустой сегмент для поиска, возвращается пустой список.")
         return []
     if top_k <= 0:
-        logger.warning(f"Недопустимое значение top_k ({top_k}), возвращается пустой список.")
+        logger.warning("Недопустимое значение top_k (%s), возвращается пустой список.", top_k)
         return []
 
     try:
-        # Проверка: коллекция существует, но пуста
-        if collection.count() == 0:
-            logger.warning("🔄 Коллекция Chroma пуста. Запускаю пересборку базы...")
-
-            # Шаг 1: Распаковка архива
-            if os.path.exists(RAW_DATA_DIR):
-                logger.info("Начинаю распаковку архива")
-                try:
-                    extract_nested_zip(ZIP_PATH, PROCESSED_DATA_DIR)
-                except Exception as e:
-                    logger.error(f"Не удалось распаковать архив {e}")
-                logger.info("📦 Архив успешно распакован.")
-            else:
-                logger.error(f"❌ Архив не найден по пути: {RAW_DATA_DIR}")
-                return []
-
-            # Шаг 2: Построение базы знаний
-            builder = KnowledgeBaseBuilder()
-            builder.ingest()
-            logger.info("✅ База знаний успешно создана.")
-
-            # Пересоздаем collection, чтобы она увидела изменения
-            collection = get_chroma_client().get_or_create_collection(CHROMA_COLLECTION_NAME)
-
         # Создание эмбеддинга и поиск
         query_embedding = embedder.encode(segment)
         results = collection.query(query_embeddings=[query_embedding], n_results=top_k)
         chunks = results.get("documents", [[]])[0]
 
-        logger.info(f"🔎 Найдено {len(chunks)} чанков по сегменту '{segment}' (семантический поиск).")
+        logger.info("🔎 Найдено %d чанков по сегменту '%s' (семантический поиск).", len(chunks), segment)
         return chunks
 
     except Exception as e:
-        logger.error(f"❌ Ошибка при семантическом поиске: {e}")
+        logger.error("❌ Ошибка при семантическом поиске: %s", e)
         return []
+
+
+async def query_shards(
+    shards: Sequence,
+    query_embedding: Sequence[float],
+    top_k: int,
+    timeout: float = SHARD_TIMEOUT_MS / 1000,
+) -> Dict[str, list]:
+    """
+    Параллельно опрашивает шарды базы знаний и объединяет лучшие результаты.
+
+    Каждый шард возвращает свои top_k чанков, итоговые top_k выбираются по
+    квадрату L2-расстояния. Шард, не ответивший за timeout или недоступный,
+    пропускается: возвращается частичный результат по остальным шардам.
+
+    Args:
+        shards: Клиенты серверов шардов (ShardClient).
+        query_embedding: Эмбеддинг запроса.
+        top_k: Сколько чанков вернуть.
+        timeout: Таймаут ответа одного шарда в секундах.
+
+    Returns:
+        Словарь в формате ответа collection.query и число неответивших шардов (missing_shards).
+    """
+    responses = await asyncio.gather(
+        *(asyncio.wait_for(shard.query(query_embedding, top_k), timeout) for shard in shards),
+        return_exceptions=True,
+    )
+
+    hits, missing = [], 0
+    for shard, response in zip(shards, responses):
+        if isinstance(response, BaseException):
+            missing += 1
+            logger.warning("Шард %s не ответил: %r", shard.address, response)
+            continue
+        hits.extend(zip(response["distances"], response["ids"], response["documents"], response["metadatas"]))
+
+    top = heapq.nsmallest(top_k, hits, key=itemgetter(0))
+    return {
+        "ids": [[hit[1] for hit in top]],
+        "documents": [[hit[2] for hit in top]],
+        "metadatas": [[hit[3] for hit in top]],
+        "distances": [[hit[0] for hit in top]],
+        "missing_shards": missing,
+    }
+
+
+async def afind_relevant_chunks_by_segment(
+    segment: str,
+    collection,
+    embedder: SentenceTransformer,
+    top_k: int = 5,
+) -> List[str]:
+    """
+    Асинхронный семантический поиск: для базы, разбитой на шарды, опрашивает шарды параллельно.
+
+    Для резидентного индекса или коллекции ChromaDB выполняет find_relevant_chunks_by_segment
+    в пуле потоков, чтобы поиск не блокировал event loop и мог быть прерван по таймауту.
+
+    Args:
+        segment: Сегмент (например, "маркетинговое агентство").
+        collection: Коллекция ChromaDB, резидентный индекс или ShardedIndex.
+        embedder: Модель эмбеддингов (SentenceTransformer).
+        top_k: Сколько самых похожих чанков вернуть.
+
+    Returns:
+        Список релевантных чанков.
+    """
+    shards = getattr(collection, "shards", None)
+    if not shards:
+        return await asyncio.to_thread(find_relevant_chunks_by_segment, segment, collection, embedder, top_k)
+
+    # Проверка входных данных
+    if not segment.strip() or top_k <= 0:
+        logger.warning("Пустой сегмент или недопустимое значение top_k (%s), возвращается пустой список.", top_k)
+        return []
+
+    try:
+        query_embedding = await asyncio.to_thread(embedder.encode, segment)
+        results = await query_shards(shards, query_embedding, top_k)
+        chunks = results["documents"][0]
+
+        logger.info(
+            "🔎 Найдено %d чанков по сегменту '%s' (шардов: %d, не ответили: %d).",
+            len(chunks), segment, len(shards), results["missing_shards"],
+        )
+        return chunks
+
+    except Exception as e:
+        logger.error("❌ Ошибка при семантическом поиске по шардам: %s", e)
+        return []
+
+
+class ChunkCache:
+    """
+    Кэш последних результатов поиска для ответа при нехватке времени.
+
+    Хранит чанки по паре (база знаний, сегмент) с LRU-вытеснением, а также
+    последние найденные чанки каждой базы — общий контекст продукта на случай,
+    когда для сегмента ещё нет сохранённого результата.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[Optional[str], str], List[str]]" = OrderedDict()
+        self._generic: Dict[Optional[str], List[str]] = {}
+
+    def put(self, knowledge_base_id: Optional[str], segment: str, chunks: List[str]) -> None:
+        """Сохраняет результат поиска."""
+        key = (knowledge_base_id, segment.strip().lower())
+        self._entries[key] = chunks
+        self._entries.move_to_end(key)
+        self._generic[knowledge_base_id] = chunks
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, knowledge_base_id: Optional[str], segment: str) -> Tuple[List[str], str]:
+        """
+        Возвращает сохранённые чанки для сегмента или общий контекст базы.
+
+        Args:
+            knowledge_base_id: Идентификатор базы знаний.
+            segment: Сегмент рынка компании.
+
+        Returns:
+            Кортеж (чанки, источник): источник "cached", "generic" или "" (чанков нет).
+        """
+        chunks = self._entries.get((knowledge_base_id, segment.strip().lower()))
+        if chunks is not None:
+            return chunks, "cached"
+        chunks = self._generic.get(knowledge_base_id)
+        if chunks is not None:
+            return chunks, "generic"
+        return [], ""
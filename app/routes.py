@@ -1,17 +1,46 @@
+import logging
+import time
 
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, Field
-from typing import Dict
-from app.letter_pipeline.graph import chain
-import psutil
-
-from utils.logger import setup_logger
+from pydantic import BaseModel, Field, field_validator
+from typing import Any, Dict, List, Literal, Optional
+from app.admission import AdmissionController, AdmissionRejected
+from app.knowledge_registry import DEFAULT_KNOWLEDGE_BASE
+from app.letter_pipeline.graph import chain, pipeline_metrics
+from app.letter_pipeline.nodes import embedder, knowledge_registry
+from app.retrieval import afind_relevant_chunks_by_segment
+
+from data_ingestion.config import (
+    ADMISSION_MAX_IN_FLIGHT,
+    ADMISSION_MAX_WAIT,
+    ADMISSION_QUEUE_SIZE_BULK,
+    ADMISSION_QUEUE_SIZE_INTERACTIVE,
+    MAX_LETTER_VARIANTS,
+)
+from utils.logger import RSS_MB, dropped_log_records, setup_logger
 
 # Инициализация логгера ДО импорта роутера
 logger = setup_logger("letter_pipeline")
 
 router = APIRouter()
 
+# Идентификатор базы знаний входит в имя коллекции ChromaDB: начинается и заканчивается буквой или цифрой
+KNOWLEDGE_BASE_ID_PATTERN = r"^[A-Za-z0-9](?:[A-Za-z0-9_-]*[A-Za-z0-9])?$"
+
+
+def validate_knowledge_base_id(value: Optional[str]) -> Optional[str]:
+    """Запрещает идентификатор, под которым реестр хранит основную базу."""
+    if value == DEFAULT_KNOWLEDGE_BASE:
+        raise ValueError(f"Идентификатор '{DEFAULT_KNOWLEDGE_BASE}' зарезервирован за основной базой знаний.")
+    return value
+
+# Контроль допуска: ограничение параллельных конвейеров и очереди по полосам приоритета
+admission_controller = AdmissionController(
+    max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+    queue_sizes={"interactive": ADMISSION_QUEUE_SIZE_INTERACTIVE, "bulk": ADMISSION_QUEUE_SIZE_BULK},
+    max_wait=ADMISSION_MAX_WAIT,
+)
+
 
 # Определение модели для пользовательского ввода
 class UserInput(BaseModel):
@@ -23,11 +52,17 @@ class UserInput(BaseModel):
         должность: Должность контактного лица.
         название_компании: Название компании.
         сегмент: Сегмент рынка компании.
+        база_знаний: Идентификатор базы знаний продуктовой линии (по умолчанию основная).
     """
     контакт: str = Field(..., max_length=100, description="Имя контактного лица")
     должность: str = Field(..., max_length=100, description="Должность контактного лица")
     название_компании: str = Field(..., max_length=200, description="Название компании")
     сегмент: str = Field(..., max_length=100, description="Сегмент рынка компании")
+    база_знаний: Optional[str] = Field(
+        None, max_length=64, pattern=KNOWLEDGE_BASE_ID_PATTERN, description="Идентификатор базы знаний"
+    )
+
+    _check_knowledge_base_id = field_validator("база_знаний")(validate_knowledge_base_id)
 
 
 # Определение модели для тела запроса
@@ -37,13 +72,38 @@ class RequestBody(BaseModel):
 
     Attributes:
         user_input: Данные пользователя для генерации письма.
+        priority: Полоса приоритета: interactive (одиночные письма) или bulk (массовые рассылки).
+        variants: Количество вариантов письма (по одному поиску и одному промпту).
+        deadline_ms: Бюджет времени на запрос в миллисекундах (с момента получения).
     """
     user_input: UserInput
+    priority: Literal["interactive", "bulk"] = Field("interactive", description="Полоса приоритета")
+    variants: int = Field(1, ge=1, le=MAX_LETTER_VARIANTS, description="Количество вариантов письма")
+    deadline_ms: Optional[int] = Field(None, ge=1, le=600000, description="Бюджет времени на запрос, мс")
+
+
+# Определение модели для запроса поиска чанков
+class SearchBody(BaseModel):
+    """
+    Модель для тела запроса семантического поиска.
+
+    Attributes:
+        сегмент: Сегмент рынка компании.
+        top_k: Количество чанков в ответе.
+        база_знаний: Идентификатор базы знаний продуктовой линии.
+    """
+    сегмент: str = Field(..., max_length=100, description="Сегмент рынка компании")
+    база_знаний: Optional[str] = Field(
+        None, max_length=64, pattern=KNOWLEDGE_BASE_ID_PATTERN, description="Идентификатор базы знаний"
+    )
+
+    _check_knowledge_base_id = field_validator("база_знаний")(validate_knowledge_base_id)
+    top_k: int = Field(5, ge=1, le=20, description="Количество чанков в ответе")
 
 
 # Определение эндпоинта для генерации письма
 @router.post("/generate_email")
-async def generate_letter(body: RequestBody) -> Dict[str, str]:
+async def generate_letter(body: RequestBody) -> Dict[str, Any]:
     """
     Генерирует персонализированное деловое письмо на основе пользовательских данных.
 
@@ -51,41 +111,125 @@ async def generate_letter(body: RequestBody) -> Dict[str, str]:
         body: Тело запроса с пользовательскими данными.
 
     Returns:
-        Словарь с сгенерированным письмом.
+        Словарь с сгенерированным письмом; при variants > 1 — также список
+        успешно сгенерированных вариантов (их может быть меньше запрошенного);
+        при deadline_ms — список этапов, выполненных в упрощённом режиме (degraded).
 
     Raises:
-        HTTPException: Если произошла ошибка при генерации письма.
+        HTTPException: Если сервис перегружен (429), письмо не уложилось
+            в бюджет времени (504) или произошла ошибка при генерации письма.
     """
+    # Бюджет времени отсчитывается с момента получения запроса, включая ожидание допуска
+    deadline = time.monotonic() + body.deadline_ms / 1000 if body.deadline_ms else None
+
     # Преобразование Pydantic модели в словарь
     logger.info("Получен запрос")
     user_input = body.user_input.dict()
+    if not knowledge_registry.exists(user_input["база_знаний"]):
+        raise HTTPException(status_code=404, detail="База знаний не найдена.")
 
     # Логирование пользовательского ввода (обрезка для экономии памяти)
-    logger.debug(f"Получен user_input: {str(user_input)[:500]}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Получен user_input: %s", str(user_input)[:500])
+
+    # Допуск к конвейеру: при перегрузке запрос быстро отклоняется,
+    # ожидание в очереди не превышает остатка бюджета времени
+    remaining = None if deadline is None else deadline - time.monotonic()
+    if remaining is not None and remaining <= 0:
+        raise HTTPException(status_code=504, detail="Бюджет времени запроса истёк до допуска к генерации.")
+    try:
+        admitted_at = await admission_controller.acquire(body.priority, max_wait=remaining)
+    except AdmissionRejected as e:
+        if e.reason == "deadline":
+            raise HTTPException(status_code=504, detail="Бюджет времени запроса истёк в очереди допуска.")
+        raise HTTPException(
+            status_code=429,
+            detail="Сервис перегружен, повторите запрос позже.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
 
     # Вызов конвейера для генерации письма
     try:
-        result = await chain.ainvoke({"user_input": user_input})
+        result = await chain.ainvoke(
+            {"user_input": user_input, "variants": body.variants, "deadline": deadline, "degraded": []}
+        )
 
         subject = result.get("subject", "").strip()
         body_text = result.get("letter", "").strip()
+        degraded = result.get("degraded", [])
 
         # Проверка наличия письма в результате
         if not body_text:
+            if degraded:
+                logger.error("Письмо не сгенерировано в пределах бюджета времени: %s.", degraded)
+                raise HTTPException(
+                    status_code=504,
+                    detail=f"Письмо не сгенерировано в пределах бюджета времени (этапы: {', '.join(degraded)}).",
+                )
             logger.error("Письмо не сгенерировано.")
             raise HTTPException(status_code=500, detail="Не удалось сгенерировать письмо.")
 
         # Логирование потребления памяти
-        logger.info(
-            f"Потребление памяти после генерации письма: "
-            f"{psutil.Process().memory_info().rss / 1024**2:.2f} МБ"
-        )
-        logger.debug(f"Тема: {subject}\nТекст письма: {body_text[:1000]}")
+        logger.info("Потребление памяти после генерации письма: %s МБ", RSS_MB)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Тема: %s\nТекст письма: %s", subject, body_text[:1000])
 
         # Формирование ответа
-        return {"subject": subject, "letter": body_text}
+        response = {"subject": subject, "letter": body_text}
+        if body.variants > 1:
+            response["variants"] = [
+                {"subject": letter["subject"].strip(), "letter": letter["letter"].strip()}
+                for letter in result.get("letters", [])
+            ]
+        if deadline is not None:
+            response["degraded"] = degraded
+        return response
+
+    except HTTPException:
+        raise
 
     except Exception as e:
         # Логирование ошибки и возврат HTTP-ошибки
-        logger.error(f"Ошибка при генерации письма: {e}")
-        raise HTTPException(status_code=500, detail=f"Ошибка при генерации письма: {str(e)}")
\ No newline at end of file
+        logger.error("Ошибка при генерации письма: %s", e)
+        raise HTTPException(status_code=500, detail=f"Ошибка при генерации письма: {str(e)}")
+
+    finally:
+        admission_controller.release(admitted_at)
+
+
+# Определение эндпоинта для поиска чанков (без обращения к LLM)
+@router.post("/search_chunks")
+async def search_chunks(body: SearchBody) -> Dict[str, List[str]]:
+    """
+    Возвращает релевантные чанки базы знаний по сегменту.
+
+    Используется для отладки поиска и нагрузочного тестирования без вызова LLM.
+
+    Args:
+        body: Тело запроса с сегментом.
+
+    Returns:
+        Словарь со списком чанков.
+    """
+    if not knowledge_registry.exists(body.база_знаний):
+        raise HTTPException(status_code=404, detail="База знаний не найдена.")
+    collection = await knowledge_registry.aget(body.база_знаний)
+    chunks = await afind_relevant_chunks_by_segment(body.сегмент, collection, embedder, top_k=body.top_k)
+    return {"chunks": chunks}
+
+
+# Определение эндпоинта для экспорта метрик
+@router.get("/metrics")
+def metrics() -> Dict[str, Any]:
+    """
+    Возвращает метрики сервиса: резидентные базы знаний, контроль допуска, конвейер и логирование.
+
+    Returns:
+        Словарь метрик.
+    """
+    return {
+        "knowledge_bases": knowledge_registry.metrics(),
+        "admission": admission_controller.metrics(),
+        "pipeline": pipeline_metrics(),
+        "log_records_dropped": dropped_log_records(),
+    }
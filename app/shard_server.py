@@ -0,0 +1,64 @@
+"""
+Сервер поиска по одному шарду базы знаний.
+
+Загружает шард, построенный data_ingestion.shards.build_shards, и отвечает
+на запросы ближайших соседей по TCP. Протокол — JSON-строки: запрос
+{"embedding": [...], "k": 5}, ответ {"ids", "documents", "metadatas",
+"distances"} или {"error": "..."}. После запуска печатает в stdout строку
+"READY <host> <port>" (при --port 0 порт выбирается системой).
+
+Пример запуска:
+    python -m app.shard_server --path shards/<коллекция>/shard_0 --port 9100
+"""
+import argparse
+import asyncio
+import json
+
+from data_ingestion.shards import load_shard
+from utils.logger import setup_logger
+
+# Инициализация логгера
+logger = setup_logger("shard_server")
+
+
+def make_handler(index):
+    """Создаёт обработчик соединений для индекса шарда."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    result = index.query(query_embeddings=[request["embedding"]], n_results=int(request["k"]))
+                    response = {key: values[0] for key, values in result.items()}
+                except Exception as e:
+                    logger.error("Ошибка при обработке запроса: %s", e)
+                    response = {"error": str(e)}
+                writer.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def serve(path: str, host: str, port: int) -> None:
+    """Загружает шард и обслуживает запросы до остановки процесса."""
+    index = load_shard(path)
+    server = await asyncio.start_server(make_handler(index), host, port)
+    host, port = server.sockets[0].getsockname()[:2]
+    logger.info("Шард '%s' (%d чанков) обслуживается на %s:%d.", path, index.count(), host, port)
+    print(f"READY {host} {port}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", required=True, help="Директория шарда")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(serve(args.path, args.host, args.port))
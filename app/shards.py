@@ -0,0 +1,217 @@
+import asyncio
+import atexit
+import json
+import os
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from data_ingestion.config import PROJECT_ROOT, SHARD_START_TIMEOUT
+from data_ingestion.shards import shard_paths
+from utils.logger import setup_logger
+
+# Инициализация логгера
+logger = setup_logger("shards")
+
+
+class ShardClient:
+    """
+    Клиент сервера поиска одного шарда (app.shard_server).
+
+    Держит пул открытых соединений: соединение берётся на время запроса
+    и возвращается в пул после ответа, при ошибке закрывается.
+
+    Attributes:
+        host: Адрес сервера шарда.
+        port: Порт сервера шарда.
+    """
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self._idle: List[tuple] = []
+        self._pid = os.getpid()
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    async def query(self, embedding: Sequence[float], k: int) -> dict:
+        """
+        Запрашивает k ближайших чанков шарда.
+
+        Args:
+            embedding: Эмбеддинг запроса.
+            k: Количество результатов.
+
+        Returns:
+            Словарь со списками ids, documents, metadatas, distances.
+
+        Raises:
+            ConnectionError: Если сервер шарда недоступен или вернул ошибку.
+        """
+        # Соединения не переживают fork и смену event loop
+        if self._pid != os.getpid():
+            self._idle, self._pid = [], os.getpid()
+        loop = asyncio.get_running_loop()
+        while self._idle:
+            idle_loop, reader, writer = self._idle.pop()
+            if idle_loop is loop and not writer.is_closing():
+                break
+            if not idle_loop.is_closed():
+                writer.close()
+        else:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+
+        try:
+            request = {"embedding": [float(x) for x in embedding], "k": k}
+            writer.write(json.dumps(request).encode("utf-8") + b"\n")
+            await writer.drain()
+            line = await reader.readline()
+        except BaseException:
+            # Отменённый (по таймауту) запрос оставляет соединение в неизвестном состоянии
+            writer.close()
+            raise
+        if not line:
+            writer.close()
+            raise ConnectionError(f"Шард {self.address} закрыл соединение.")
+
+        self._idle.append((loop, reader, writer))
+        response = json.loads(line)
+        if "error" in response:
+            raise ConnectionError(f"Шард {self.address}: {response['error']}")
+        return response
+
+
+class ShardedIndex:
+    """
+    База знаний, разбитая на шарды, каждый из которых обслуживает свой сервер.
+
+    Поиск выполняется в app.retrieval.query_shards: запрос рассылается всем
+    шардам параллельно, лучшие результаты объединяются по расстоянию.
+    Резидентная память процесса не расходуется — данные хранят серверы шардов.
+
+    Attributes:
+        name: Имя коллекции, по которой построены шарды.
+        shards: Клиенты серверов шардов.
+    """
+
+    nbytes = 0
+
+    def __init__(
+        self,
+        name: str,
+        shards: List[ShardClient],
+        total: int,
+        processes: Optional[List[subprocess.Popen]] = None,
+    ) -> None:
+        self.name = name
+        self.shards = shards
+        self._total = total
+        self._processes = processes or []
+        self._owner_pid = os.getpid()
+
+    def count(self) -> int:
+        """Возвращает количество чанков во всех шардах."""
+        return self._total
+
+    def close(self) -> None:
+        """Останавливает локальные серверы шардов (только в создавшем их процессе)."""
+        if os.getpid() != self._owner_pid:
+            return
+        for process in self._processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in self._processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self._processes = []
+
+
+def _forward_output(process: subprocess.Popen) -> None:
+    """Пересылает вывод сервера шарда в stdout, чтобы канал не переполнялся."""
+    for line in process.stdout:
+        sys.stdout.write(line)
+
+
+def _start_shard_server(path) -> subprocess.Popen:
+    """Запускает сервер шарда подпроцессом."""
+    return subprocess.Popen(
+        [sys.executable, "-m", "app.shard_server", "--path", str(path), "--port", "0"],
+        cwd=PROJECT_ROOT,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+
+
+def _wait_ready(process: subprocess.Popen, path) -> tuple:
+    """Дожидается строки READY от сервера шарда и возвращает его адрес."""
+    ready = {}
+
+    def read_ready() -> None:
+        for line in process.stdout:
+            if line.startswith("READY "):
+                _, host, port = line.split()
+                ready["address"] = (host, int(port))
+                return
+            sys.stdout.write(line)
+
+    # Чтение строки READY с ограничением по времени (загрузка шарда)
+    reader = threading.Thread(target=read_ready, daemon=True)
+    reader.start()
+    reader.join(SHARD_START_TIMEOUT)
+    if "address" not in ready:
+        raise RuntimeError(f"Сервер шарда '{path}' не запустился за {SHARD_START_TIMEOUT} секунд.")
+
+    threading.Thread(target=_forward_output, args=(process,), daemon=True).start()
+    return ready["address"]
+
+
+def spawn_local_shards(collection_name: str) -> Optional[ShardedIndex]:
+    """
+    Запускает локальные серверы шардов коллекции.
+
+    Args:
+        collection_name: Имя коллекции ChromaDB.
+
+    Returns:
+        Объект ShardedIndex или None, если коллекция не разбита на шарды.
+    """
+    paths = shard_paths(collection_name)
+    if not paths:
+        return None
+    return spawn_shard_servers(collection_name, paths)
+
+
+def spawn_shard_servers(name: str, paths: List[Path]) -> ShardedIndex:
+    """
+    Запускает серверы для директорий шардов подпроцессами.
+
+    Args:
+        name: Имя базы (коллекции), которой принадлежат шарды.
+        paths: Директории шардов.
+
+    Returns:
+        Объект ShardedIndex, останавливающий серверы при close() и выходе из процесса.
+    """
+    # Серверы шардов загружают данные параллельно
+    processes, clients, total = [_start_shard_server(path) for path in paths], [], 0
+    try:
+        for process, path in zip(processes, paths):
+            host, port = _wait_ready(process, path)
+            clients.append(ShardClient(host, port))
+            with open(path / "meta.json", "r", encoding="utf-8") as f:
+                total += json.load(f)["count"]
+    except Exception:
+        for process in processes:
+            process.kill()
+        raise
+
+    index = ShardedIndex(name, clients, total, processes)
+    atexit.register(index.close)
+    logger.info("Запущено %d серверов шардов для '%s' (%d чанков).", len(clients), name, total)
+    return index
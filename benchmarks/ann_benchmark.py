@@ -0,0 +1,107 @@
+"""
+Бенчмарк приближённого индекса IVF/int8 на синтетических чанках.
+
+Для каждого размера корпуса строит индекс по синтетическим эмбеддингам
+(смесь гауссиан на единичной сфере, размерность как у all-MiniLM-L6-v2),
+и для нескольких значений nprobe выводит recall@5 относительно точного поиска,
+задержку запроса p50/p99 и объём памяти на вектор.
+
+Пример запуска:
+    python -m benchmarks.ann_benchmark --sizes 10000 100000 1000000 --nprobe 4 8 16 32
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from data_ingestion.ann_index import build_ivf_int8_index
+
+DIM = 384
+PAGE_SIZE = 50000
+
+
+def synthetic_pages(count: int, dim: int, seed: int, clusters: int = 1000):
+    """Порождает страницы синтетических эмбеддингов, текстов и метаданных."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    for lo in range(0, count, PAGE_SIZE):
+        size = min(PAGE_SIZE, count - lo)
+        vectors = centers[rng.integers(0, clusters, size)] + 0.5 * rng.standard_normal((size, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        ids = [f"doc_{lo + i}" for i in range(size)]
+        yield vectors, [f"Синтетический чанк {i}" for i in ids], [{"source": "synthetic"}] * size, ids
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> tuple:
+    """Точный поиск блоками; возвращает (индексы, среднюю задержку на запрос в мс)."""
+    sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+    result = np.empty((len(queries), k), dtype=np.int64)
+    start = time.perf_counter()
+    for i, query in enumerate(queries):
+        distances = sq_norms - 2.0 * (vectors @ query)
+        top = np.argpartition(distances, k - 1)[:k]
+        result[i] = top[np.argsort(distances[top])]
+    return result, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def run(size: int, nprobes: list, queries_count: int, k: int, seed: int) -> list:
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        build_start = time.perf_counter()
+        index = build_ivf_int8_index(synthetic_pages(size, DIM, seed), Path(tmp) / "index")
+        build_time = time.perf_counter() - build_start
+
+        # Запросы — зашумлённые векторы корпуса
+        rng = np.random.default_rng(seed + 1)
+        vectors = np.asarray(index.vectors)
+        queries = vectors[rng.choice(size, queries_count, replace=False)]
+        queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+        truth, exact_ms = exact_top_k(vectors, queries, k)
+
+        for nprobe in nprobes:
+            latencies, hits = [], 0
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                found, _ = index.search(query, k, nprobe=nprobe)
+                latencies.append(time.perf_counter() - start)
+                hits += len(set(found.tolist()) & set(expected.tolist()))
+            latencies.sort()
+            rows.append({
+                "size": size,
+                "nlist": len(index.centroids),
+                "nprobe": nprobe,
+                "recall": hits / (len(queries) * k),
+                "p50_ms": latencies[len(latencies) // 2] * 1000,
+                "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+                "exact_ms": exact_ms,
+                "resident_bytes_per_vector": index.nbytes / size,
+                "float32_bytes_per_vector": DIM * 4,
+                "build_s": build_time,
+            })
+        del index, vectors
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк IVF/int8 индекса")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(
+        f"{'size':>9} {'nlist':>6} {'nprobe':>6} {'recall@' + str(args.k):>9} {'p50 ms':>8} "
+        f"{'p99 ms':>8} {'exact ms':>9} {'B/vec':>7} {'f32 B/vec':>9} {'build s':>8}"
+    )
+    for size in args.sizes:
+        for row in run(size, args.nprobe, args.queries, args.k, args.seed):
+            print(
+                f"{row['size']:>9} {row['nlist']:>6} {row['nprobe']:>6} {row['recall']:>9.3f} "
+                f"{row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['exact_ms']:>9.2f} "
+                f"{row['resident_bytes_per_vector']:>7.1f} {row['float32_bytes_per_vector']:>9} "
+                f"{row['build_s']:>8.1f}"
+            )
@@ -0,0 +1,70 @@
+"""
+Бенчмарк пропускной способности кодирования чанков базы знаний.
+
+Сравнивает прежнюю схему (кодирование чанков каждого документа отдельно,
+батчами по 100) и общий буфер чанков между документами с размером батча,
+подобранным по числу потоков torch. Чанки берутся из реального корпуса
+(data/processed и PDF), кэш эмбеддингов не используется.
+
+Пример запуска (архив статей должен быть распакован в data/processed):
+    python -m benchmarks.embedding_benchmark --buffer 2048
+"""
+import argparse
+import time
+
+import torch
+from llama_index.core.node_parser import SentenceSplitter
+from sentence_transformers import SentenceTransformer
+
+from data_ingestion.config import CHUNK_OVERLAP, CHUNK_SIZE, EMBEDDING_MODEL_NAME, PDF_PATH, PROCESSED_DATA_DIR
+from data_ingestion.ingestor import embedding_batch_size
+from data_ingestion.loader import read_md_documents, read_pdf_document
+
+
+def load_corpus() -> list:
+    """Возвращает чанки корпуса, сгруппированные по документам."""
+    splitter = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    documents = [*read_md_documents(PROCESSED_DATA_DIR), read_pdf_document(PDF_PATH)]
+    return [splitter.split_text(doc.text) for doc in documents if doc.text]
+
+
+def per_document(embedder: SentenceTransformer, corpus: list) -> float:
+    start = time.perf_counter()
+    for chunks in corpus:
+        for i in range(0, len(chunks), 100):
+            embedder.encode(chunks[i : i + 100])
+    return time.perf_counter() - start
+
+
+def buffered(embedder: SentenceTransformer, corpus: list, buffer_size: int, batch_size: int) -> float:
+    start = time.perf_counter()
+    buffer = []
+    for chunks in corpus:
+        buffer.extend(chunks)
+        if len(buffer) >= buffer_size:
+            embedder.encode(buffer, batch_size=batch_size)
+            buffer = []
+    if buffer:
+        embedder.encode(buffer, batch_size=batch_size)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buffer", type=int, default=2048, help="Размер общего буфера чанков")
+    parser.add_argument("--batch", type=int, default=0, help="Размер батча (0 — по числу потоков)")
+    args = parser.parse_args()
+
+    embedder = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    corpus = load_corpus()
+    total = sum(len(chunks) for chunks in corpus)
+    batch_size = args.batch or embedding_batch_size()
+    print(f"Документов: {len(corpus)}, чанков: {total}, потоков torch: {torch.get_num_threads()}")
+
+    # Прогрев модели
+    embedder.encode(corpus[0][:8])
+
+    elapsed = per_document(embedder, corpus)
+    print(f"{'по документам, батч 100':>32}: {total / elapsed:8.1f} чанков/с")
+    elapsed = buffered(embedder, corpus, args.buffer, batch_size)
+    print(f"{f'общий буфер {args.buffer}, батч {batch_size}':>32}: {total / elapsed:8.1f} чанков/с")
@@ -0,0 +1,144 @@
+"""
+Бенчмарк накладных расходов исполнителя конвейера письма.
+
+Сравнивает chain.ainvoke LangGraph и LinearPipeline на синтетических узлах
+той же формы, что и узлы конвейера (чанки, промпт, письмо), без обращения
+к модели эмбеддингов и OpenAI — измеряется только стоимость исполнителя
+и передачи состояния. Для каждого варианта выводит задержку на запрос
+(среднее, p50, p99) и пиковый объём выделенной памяти на запрос (tracemalloc).
+
+Варианты:
+    langgraph+copy    — LangGraph, узлы копируют состояние ({**state, ...})
+    langgraph         — LangGraph, узлы возвращают только изменённые ключи
+    linear            — LinearPipeline, один изменяемый словарь состояния
+
+Пример запуска:
+    python -m benchmarks.pipeline_benchmark --requests 2000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import tracemalloc
+
+from langgraph.graph import StateGraph
+
+from app.letter_pipeline.executor import LinearPipeline
+from app.letter_pipeline.types import LetterState
+
+CHUNKS = ["Синтетический чанк базы знаний. " * 10] * 5
+PROMPT = "Синтетический промпт письма. " * 150
+LETTER = "Синтетический текст письма. " * 60
+
+
+async def input_node(state):
+    return {}
+
+
+async def search_node(state):
+    return {"chunks": list(CHUNKS)}
+
+
+async def prompt_node(state):
+    return {"prompt": PROMPT + state["user_input"]["сегмент"]}
+
+
+async def generate_node(state):
+    return {"subject": "Тема", "letter": LETTER, "letters": [{"subject": "Тема", "letter": LETTER}]}
+
+
+async def output_node(state):
+    return {}
+
+
+def copying(node):
+    """Оборачивает узел в прежний стиль: полная копия состояния на каждом шаге."""
+
+    async def wrapper(state):
+        return {**state, **(await node(state))}
+
+    return wrapper
+
+
+STEPS = [
+    ("input", input_node),
+    ("search", search_node),
+    ("prompt", prompt_node),
+    ("generate", generate_node),
+    ("output", output_node),
+]
+
+
+def build_graph(steps):
+    graph = StateGraph(LetterState)
+    for name, node in steps:
+        graph.add_node(name, node)
+    graph.set_entry_point(steps[0][0])
+    for (name, _), (next_name, _) in zip(steps, steps[1:]):
+        graph.add_edge(name, next_name)
+    graph.set_finish_point(steps[-1][0])
+    return graph.compile()
+
+
+def make_input(i: int) -> dict:
+    return {
+        "user_input": {
+            "контакт": "Иван Иванов",
+            "должность": "Технический директор",
+            "название_компании": f"Компания {i}",
+            "сегмент": "маркетинговое агентство",
+        },
+        "variants": 1,
+    }
+
+
+async def measure(chain, requests: int) -> dict:
+    # Прогрев
+    for i in range(50):
+        await chain.ainvoke(make_input(i))
+
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        await chain.ainvoke(make_input(i))
+        latencies.append((time.perf_counter() - start) * 1e6)
+    latencies.sort()
+
+    # Пиковая память на запрос — отдельным проходом, tracemalloc искажает время
+    peaks = []
+    tracemalloc.start()
+    for i in range(min(requests, 200)):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        await chain.ainvoke(make_input(i))
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    return {
+        "mean_us": statistics.fmean(latencies),
+        "p50_us": latencies[len(latencies) // 2],
+        "p99_us": latencies[int(len(latencies) * 0.99) - 1],
+        "peak_kib": statistics.fmean(peaks) / 1024,
+    }
+
+
+async def main(requests: int) -> None:
+    variants = {
+        "langgraph+copy": build_graph([(name, copying(node)) for name, node in STEPS]),
+        "langgraph": build_graph(STEPS),
+        "linear": LinearPipeline(STEPS),
+    }
+    print(f"{'executor':>16} {'mean, мкс':>10} {'p50, мкс':>10} {'p99, мкс':>10} {'пик, КиБ':>10}")
+    for name, chain in variants.items():
+        row = await measure(chain, requests)
+        print(
+            f"{name:>16} {row['mean_us']:>10.1f} {row['p50_us']:>10.1f} "
+            f"{row['p99_us']:>10.1f} {row['peak_kib']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="Число запросов на вариант")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
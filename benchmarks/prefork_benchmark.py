@@ -0,0 +1,123 @@
+"""
+Бенчмарк многопроцессного режима: память на воркер и суммарный RPS.
+
+Для каждого числа воркеров запускает serve.py, нагружает эндпоинт /search_chunks
+(модель эмбеддингов + поиск по индексу, без обращения к LLM) и выводит:
+RSS, PSS и USS на воркер (PSS учитывает разделяемые copy-on-write страницы),
+а также RPS и задержки p50/p99.
+
+Пример запуска:
+    python -m benchmarks.prefork_benchmark --workers 1 2 4 8 --duration 20
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import psutil
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SEGMENTS = ["маркетинговое агентство", "ритейл", "IT-аутсорсинг", "логистика", "производство"]
+
+
+def _post(url: str, payload: dict, timeout: float = 30.0) -> None:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+
+
+def _wait_ready(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _post(url, {"сегмент": SEGMENTS[0]}, timeout=5)
+            return
+        except Exception:
+            time.sleep(1)
+    raise RuntimeError(f"Сервер не ответил за {timeout} секунд.")
+
+
+def _memory(master: psutil.Process) -> dict:
+    workers = master.children()
+    infos = [worker.memory_full_info() for worker in workers]
+    return {
+        "master_rss_mb": master.memory_info().rss / 1024**2,
+        "worker_rss_mb": statistics.mean(info.rss for info in infos) / 1024**2,
+        "worker_pss_mb": statistics.mean(info.pss for info in infos) / 1024**2,
+        "worker_uss_mb": statistics.mean(info.uss for info in infos) / 1024**2,
+    }
+
+
+def _load(url: str, concurrency: int, duration: float) -> dict:
+    latencies = []
+    deadline = time.monotonic() + duration
+
+    def client(worker_id: int) -> None:
+        i = worker_id
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            _post(url, {"сегмент": SEGMENTS[i % len(SEGMENTS)]})
+            latencies.append(time.perf_counter() - start)
+            i += 1
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+def run(worker_counts: list, port: int, duration: float, concurrency_per_worker: int) -> list:
+    rows = []
+    url = f"http://127.0.0.1:{port}/search_chunks"
+    for workers in worker_counts:
+        process = subprocess.Popen(
+            [sys.executable, "serve.py", "--workers", str(workers), "--port", str(port)],
+            cwd=PROJECT_ROOT,
+            stdout=subprocess.DEVNULL,
+        )
+        try:
+            _wait_ready(url, timeout=300)
+            # Прогрев всех воркеров перед замером
+            _load(url, workers * concurrency_per_worker, duration=3)
+            stats = _load(url, workers * concurrency_per_worker, duration)
+            stats.update(_memory(psutil.Process(process.pid)))
+            stats["workers"] = workers
+            rows.append(stats)
+        finally:
+            process.terminate()
+            process.wait(timeout=60)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк pre-fork режима")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--concurrency-per-worker", type=int, default=4)
+    args = parser.parse_args()
+
+    results = run(args.workers, args.port, args.duration, args.concurrency_per_worker)
+
+    print(f"{'workers':>7} {'rps':>8} {'p50 ms':>8} {'p99 ms':>8} {'rss MB':>8} {'pss MB':>8} {'uss MB':>8}")
+    for row in results:
+        print(
+            f"{row['workers']:>7} {row['rps']:>8.1f} {row['p50_ms']:>8.1f} {row['p99_ms']:>8.1f} "
+            f"{row['worker_rss_mb']:>8.1f} {row['worker_pss_mb']:>8.1f} {row['worker_uss_mb']:>8.1f}"
+        )
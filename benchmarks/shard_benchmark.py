@@ -0,0 +1,83 @@
+"""
+Бенчмарк поиска scatter-gather по шардам базы знаний.
+
+Для каждого числа шардов разбивает синтетический корпус на шарды, запускает
+локальные серверы шардов (app.shard_server) и нагружает app.retrieval.query_shards
+параллельными запросами. Выводит пропускную способность и задержку p50/p99.
+Серверы шардов — отдельные процессы, поэтому прирост пропускной способности
+ограничен числом доступных ядер (или хостов, если шарды запущены на разных машинах).
+
+Пример запуска:
+    python -m benchmarks.shard_benchmark --size 200000 --shards 1 2 4 8 --concurrency 16
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.retrieval import query_shards
+from app.shards import spawn_shard_servers
+from benchmarks.ann_benchmark import DIM, synthetic_pages
+from data_ingestion.shards import build_shards_from_pages
+
+
+async def load(index, queries: np.ndarray, concurrency: int, k: int, timeout: float) -> dict:
+    latencies, missing = [], 0
+    next_query = iter(range(len(queries)))
+
+    async def client() -> None:
+        nonlocal missing
+        for i in next_query:
+            start = time.perf_counter()
+            result = await query_shards(index.shards, queries[i], k, timeout=timeout)
+            latencies.append((time.perf_counter() - start) * 1000)
+            missing += result["missing_shards"]
+
+    # Прогрев соединений
+    await asyncio.gather(*(query_shards(index.shards, queries[0], k, timeout=timeout) for _ in range(concurrency)))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "qps": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2],
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+        "missing": missing,
+    }
+
+
+def run(size: int, shards: int, queries_count: int, concurrency: int, k: int, timeout: float, seed: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = build_shards_from_pages(synthetic_pages(size, DIM, seed), Path(tmp) / "shards", shards)
+        index = spawn_shard_servers("benchmark", paths)
+        try:
+            rng = np.random.default_rng(seed + 1)
+            queries = rng.standard_normal((queries_count, DIM)).astype(np.float32)
+            queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+            return asyncio.run(load(index, queries, concurrency, k, timeout))
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200000, help="Количество чанков в корпусе")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16, help="Параллельных запросов")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=5.0, help="Таймаут шарда, секунды")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"Ядер: {os.cpu_count()}, корпус: {args.size} чанков, параллельных запросов: {args.concurrency}")
+    print(f"{'шардов':>7} {'запросов/с':>11} {'p50, мс':>9} {'p99, мс':>9} {'не ответили':>12}")
+    for shards in args.shards:
+        row = run(args.size, shards, args.queries, args.concurrency, args.k, args.timeout, args.seed)
+        print(f"{shards:>7} {row['qps']:>11.1f} {row['p50_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['missing']:>12}")
@@ -0,0 +1,324 @@
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from chromadb.api import Collection
+
+from data_ingestion.config import ANN_INDEX_DIR, ANN_NLIST, ANN_NPROBE, ANN_RERANK
+from utils.logger import setup_logger
+from utils.vector_index import StringWriter, collection_pages, load_strings, unpack_string
+
+# Инициализация логгера
+logger = setup_logger("ann_index")
+
+# Размер блока строк при обучении и кодировании (ограничивает пиковую память)
+BLOCK_SIZE = 65536
+
+
+def _nearest(x: np.ndarray, centroids: np.ndarray, c_norms: np.ndarray) -> np.ndarray:
+    """Возвращает номер ближайшего центроида для каждой строки x."""
+    return np.argmin(c_norms - 2.0 * (x @ centroids.T), axis=1)
+
+
+def _kmeans(sample: np.ndarray, nlist: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """Обучает центроиды грубого квантователя алгоритмом Ллойда."""
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _nearest(sample, centroids, np.einsum("ij,ij->i", centroids, centroids))
+        counts = np.bincount(assignments, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+
+        # Пустые кластеры переинициализируются случайными точками
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+    return centroids
+
+
+class IVFInt8Index:
+    """
+    Приближённый индекс ближайших соседей: IVF + скалярное int8-квантование.
+
+    Векторы разбиты на nlist инвертированных списков по ближайшему центроиду.
+    В памяти хранятся только int8-коды (dim байт на вектор) и нормы, поиск идёт
+    по nprobe ближайшим спискам, после чего кандидаты переранжируются по
+    полноточным векторам, открытым через memory-map.
+
+    Повторяет интерфейс коллекции ChromaDB, используемый при поиске (count, query).
+
+    Attributes:
+        nprobe: Количество просматриваемых списков (баланс полноты и задержки).
+        rerank: Множитель числа кандидатов для переранжирования (0 — без него).
+        name: Имя коллекции, по которой построен индекс.
+    """
+
+    def __init__(self, path: Path, nprobe: int = ANN_NPROBE, rerank: int = ANN_RERANK) -> None:
+        """
+        Открывает индекс, сохранённый build_ivf_int8_index.
+
+        Args:
+            path: Директория индекса.
+            nprobe: Количество просматриваемых списков по умолчанию.
+            rerank: Множитель кандидатов для переранжирования по умолчанию.
+        """
+        self.path = Path(path)
+        self.name = self.path.name
+        with open(self.path / "meta.json", "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        self.nprobe = nprobe
+        self.rerank = rerank
+
+        # Резидентная часть индекса
+        self.centroids = np.load(self.path / "centroids.npy")
+        self._c_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        self.scale = np.load(self.path / "scale.npy")
+        self.codes = np.load(self.path / "codes.npy")
+        self.norms = np.load(self.path / "norms.npy")
+        self.list_rows = np.load(self.path / "list_rows.npy")
+        self.list_offsets = np.load(self.path / "list_offsets.npy")
+
+        # Полноточные векторы и тексты читаются с диска по требованию
+        self.vectors = np.load(self.path / "vectors.npy", mmap_mode="r")
+        self._docs = load_strings(self.path / "documents")
+        self._metas = load_strings(self.path / "metadatas")
+        self._ids = load_strings(self.path / "ids")
+
+    def count(self) -> int:
+        """Возвращает количество векторов в индексе."""
+        return int(self.meta["count"])
+
+    @property
+    def nbytes(self) -> int:
+        """Объём резидентной части индекса в байтах (без memory-map данных)."""
+        arrays = (self.centroids, self.scale, self.codes, self.norms, self.list_rows, self.list_offsets)
+        return int(sum(array.nbytes for array in arrays))
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        nprobe: Optional[int] = None,
+        rerank: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ищет k ближайших векторов к запросу.
+
+        Args:
+            query: Эмбеддинг запроса.
+            k: Количество результатов.
+            nprobe: Количество просматриваемых списков (по умолчанию self.nprobe).
+            rerank: Множитель кандидатов для переранжирования (по умолчанию self.rerank).
+
+        Returns:
+            Кортеж (номера строк, квадраты L2-расстояний), отсортированный по расстоянию.
+        """
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        rerank = self.rerank if rerank is None else rerank
+        query = np.asarray(query, dtype=np.float32)
+
+        # Выбор ближайших инвертированных списков
+        c_dist = self._c_norms - 2.0 * (self.centroids @ query)
+        probe = np.argpartition(c_dist, nprobe - 1)[:nprobe] if nprobe < len(c_dist) else np.arange(len(c_dist))
+        positions = np.concatenate(
+            [np.arange(self.list_offsets[i], self.list_offsets[i + 1]) for i in probe]
+        )
+        if positions.size == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        # Приближённые расстояния по int8-кодам: ||x||² - 2·(q ⊙ scale)·code
+        approx = self.norms[positions] - 2.0 * (self.codes[positions] @ (query * self.scale))
+        candidates = min(positions.size, k * rerank if rerank > 0 else k)
+        best = np.argpartition(approx, candidates - 1)[:candidates]
+        rows = self.list_rows[positions[best]]
+
+        if rerank > 0:
+            # Переранжирование по полноточным векторам (чтение строк в порядке файла)
+            rows = np.sort(rows)
+            diff = self.vectors[rows] - query
+            distances = np.einsum("ij,ij->i", diff, diff)
+        else:
+            distances = approx[best] + float(query @ query)
+
+        top = np.argsort(distances)[:k]
+        return rows[top], distances[top]
+
+    def query(
+        self,
+        query_embeddings: Sequence,
+        n_results: int = 10,
+        nprobe: Optional[int] = None,
+        **_,
+    ) -> Dict[str, List[list]]:
+        """
+        Поиск ближайших соседей в формате ответа collection.query.
+
+        Args:
+            query_embeddings: Список эмбеддингов запросов.
+            n_results: Количество результатов на запрос.
+            nprobe: Количество просматриваемых списков.
+
+        Returns:
+            Словарь с ключами ids, documents, metadatas, distances.
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query in queries:
+            rows, distances = self.search(query, n_results, nprobe=nprobe)
+            result["ids"].append([unpack_string(self._ids, i) for i in rows])
+            result["documents"].append([unpack_string(self._docs, i) for i in rows])
+            result["metadatas"].append([json.loads(unpack_string(self._metas, i)) for i in rows])
+            result["distances"].append(distances.tolist())
+        return result
+
+
+def build_ivf_int8_index(
+    pages: Iterator[Tuple[np.ndarray, List[str], List[Optional[dict]], List[str]]],
+    path: Path,
+    nlist: int = ANN_NLIST,
+    iterations: int = 10,
+    seed: int = 0,
+) -> IVFInt8Index:
+    """
+    Строит IVF/int8 индекс из потока страниц (эмбеддинги, тексты, метаданные, id).
+
+    Исходные данные записываются на диск постранично, обучение и кодирование
+    выполняются блоками, поэтому пиковая память не зависит от размера корпуса.
+
+    Args:
+        pages: Итератор страниц данных.
+        path: Директория индекса (перезаписывается).
+        nlist: Количество инвертированных списков (0 — выбрать автоматически).
+        iterations: Количество итераций k-means.
+        seed: Зерно генератора случайных чисел.
+
+    Returns:
+        Открытый объект IVFInt8Index.
+    """
+    start_time = time.perf_counter()
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".building")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    # Шаг 1: Потоковая запись исходных данных
+    documents = StringWriter(tmp_path / "documents")
+    metadatas = StringWriter(tmp_path / "metadatas")
+    ids = StringWriter(tmp_path / "ids")
+    parts = []
+    for embeddings, page_docs, page_metas, page_ids in pages:
+        part_path = tmp_path / f"part_{len(parts)}.npy"
+        np.save(part_path, np.asarray(embeddings, dtype=np.float32))
+        parts.append(part_path)
+        documents.extend(page_docs)
+        metadatas.extend(json.dumps(m or {}, ensure_ascii=False) for m in page_metas)
+        ids.extend(page_ids)
+    for writer in (documents, metadatas, ids):
+        writer.close()
+
+    # Склейка страниц в один файл полноточных векторов
+    shapes = [np.load(part, mmap_mode="r").shape for part in parts]
+    count = sum(shape[0] for shape in shapes)
+    dim = shapes[0][1] if shapes else 0
+    vectors = np.lib.format.open_memmap(tmp_path / "vectors.npy", mode="w+", dtype=np.float32, shape=(count, dim))
+    offset = 0
+    for part in parts:
+        block = np.load(part)
+        vectors[offset : offset + len(block)] = block
+        offset += len(block)
+        os.remove(part)
+    vectors.flush()
+
+    # Шаг 2: Обучение грубого квантователя на выборке
+    rng = np.random.default_rng(seed)
+    if not nlist:
+        nlist = int(4 * np.sqrt(count))
+    nlist = max(1, min(nlist, count // 39 or 1))
+    sample_rows = np.sort(rng.choice(count, min(count, nlist * 256), replace=False)) if count else np.zeros(0, np.int64)
+    centroids = _kmeans(np.asarray(vectors[sample_rows]), nlist, iterations, rng) if count else np.zeros((1, dim), np.float32)
+    c_norms = np.einsum("ij,ij->i", centroids, centroids)
+
+    # Шаг 3: Распределение по спискам и масштаб квантования по измерениям
+    assignments = np.empty(count, dtype=np.int64)
+    absmax = np.zeros(dim, dtype=np.float32)
+    for lo in range(0, count, BLOCK_SIZE):
+        block = np.asarray(vectors[lo : lo + BLOCK_SIZE])
+        assignments[lo : lo + len(block)] = _nearest(block, centroids, c_norms)
+        np.maximum(absmax, np.abs(block).max(axis=0), out=absmax)
+    scale = np.where(absmax > 0, absmax / 127.0, 1.0).astype(np.float32)
+
+    list_rows = np.argsort(assignments, kind="stable")
+    list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignments, minlength=len(centroids)), out=list_offsets[1:])
+
+    # Шаг 4: Кодирование векторов в порядке инвертированных списков
+    codes = np.empty((count, dim), dtype=np.int8)
+    norms = np.empty(count, dtype=np.float32)
+    for lo in range(0, count, BLOCK_SIZE):
+        rows = list_rows[lo : lo + BLOCK_SIZE]
+        block = np.asarray(vectors[np.sort(rows)])[np.argsort(np.argsort(rows))]
+        codes[lo : lo + len(rows)] = np.clip(np.rint(block / scale), -127, 127).astype(np.int8)
+        norms[lo : lo + len(rows)] = np.einsum("ij,ij->i", block, block)
+    del vectors
+
+    np.save(tmp_path / "centroids.npy", centroids.astype(np.float32))
+    np.save(tmp_path / "scale.npy", scale)
+    np.save(tmp_path / "codes.npy", codes)
+    np.save(tmp_path / "norms.npy", norms)
+    np.save(tmp_path / "list_rows.npy", list_rows)
+    np.save(tmp_path / "list_offsets.npy", list_offsets)
+    with open(tmp_path / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({"count": count, "dim": dim, "nlist": len(centroids), "quantization": "int8"}, f)
+
+    # Замена предыдущей версии индекса
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+    logger.info(
+        f"ANN-индекс построен за {time.perf_counter() - start_time:.2f} секунд: "
+        f"{count} векторов, {len(centroids)} списков."
+    )
+    return IVFInt8Index(path)
+
+
+def ann_index_path(collection_name: str) -> Path:
+    """Возвращает директорию ANN-индекса для коллекции."""
+    return ANN_INDEX_DIR / collection_name
+
+
+def build_ann_index(collection: Collection) -> IVFInt8Index:
+    """
+    Строит ANN-индекс по всем записям коллекции ChromaDB.
+
+    Args:
+        collection: Коллекция ChromaDB.
+
+    Returns:
+        Открытый объект IVFInt8Index.
+    """
+    return build_ivf_int8_index(collection_pages(collection), ann_index_path(collection.name))
+
+
+def load_ann_index(collection_name: str) -> IVFInt8Index:
+    """
+    Открывает ANN-индекс коллекции, строя его при отсутствии.
+
+    Args:
+        collection_name: Имя коллекции ChromaDB.
+
+    Returns:
+        Объект IVFInt8Index.
+    """
+    path = ann_index_path(collection_name)
+    if not (path / "meta.json").exists():
+        from utils.chroma_client import get_chroma_client
+
+        logger.warning(f"ANN-индекс для '{collection_name}' не найден, строю из коллекции.")
+        return build_ann_index(get_chroma_client().get_or_create_collection(collection_name))
+    return IVFInt8Index(path)
@@ -21,11 +21,74 @@ PDF_PATH = RAW_DATA_DIR / "Service_Console.pdf"
 # Для Chroma
 CHROMA_DB_PATH = PROJECT_ROOT / "vector_store"
 CHROMA_COLLECTION_NAME = "sales_knowledge_base"
+# Базы знаний продуктовых линий: data/tenants/<id>/*.md, *.pdf → коллекция <CHROMA_COLLECTION_NAME>__<id>
+TENANT_DATA_DIR = PROJECT_ROOT / "data" / "tenants"
+KB_MEMORY_BUDGET_MB = int(os.getenv("KB_MEMORY_BUDGET_MB", "1024"))  # бюджет резидентных индексов
+PRELOAD_KNOWLEDGE_BASES = [kb for kb in os.getenv("PRELOAD_KNOWLEDGE_BASES", "").split(",") if kb]
+# Сине-зелёная пересборка: новая версия коллекции пишется рядом с текущей и подменяет её атомарно
+KB_KEEP_VERSIONS = int(os.getenv("KB_KEEP_VERSIONS", "2"))  # текущая + версии для отката
+INGEST_WRITE_BATCH_SIZE = int(os.getenv("INGEST_WRITE_BATCH_SIZE", "5000"))
+ALIAS_CHECK_INTERVAL = float(os.getenv("ALIAS_CHECK_INTERVAL", "2.0"))  # секунды между проверками псевдонимов
+# Кодирование чанков: общий буфер между документами и размер батча модели (0 — по числу потоков)
+EMBED_BUFFER_SIZE = int(os.getenv("EMBED_BUFFER_SIZE", "2048"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "0"))
+# Потоковая сборка с бюджетом RSS (0 — без бюджета): стадии связаны очередями ограниченной длины
+INGEST_RSS_BUDGET_MB = int(os.getenv("INGEST_RSS_BUDGET_MB", "0"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
 CHUNK_SIZE = 320
 CHUNK_OVERLAP = 50
 
 # Модель эмбеддингов
 EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 
+# Кэш эмбеддингов между пересборками базы знаний
+EMBEDDING_CACHE_DIR = PROJECT_ROOT / "embedding_cache"
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "1") == "1"
+
+# Приближённый поиск (IVF + int8-квантование) для больших баз знаний
+ANN_INDEX_DIR = PROJECT_ROOT / "ann_index"
+ANN_INDEX_ENABLED = os.getenv("ANN_INDEX_ENABLED", "0") == "1"
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))  # 0 — выбирается автоматически (~4·√N)
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))  # баланс полноты и задержки
+ANN_RERANK = int(os.getenv("ANN_RERANK", "4"))  # кандидатов на переранжирование = top_k · ANN_RERANK
+
+# Шардирование базы знаний: чанки делятся на KB_SHARDS шардов (0 или 1 — без шардов),
+# каждый шард обслуживает отдельный сервер поиска (app/shard_server.py)
+SHARD_INDEX_DIR = PROJECT_ROOT / "shards"
+KB_SHARDS = int(os.getenv("KB_SHARDS", "0"))
+SHARD_TIMEOUT_MS = int(os.getenv("SHARD_TIMEOUT_MS", "500"))  # таймаут ответа одного шарда
+SHARD_START_TIMEOUT = float(os.getenv("SHARD_START_TIMEOUT", "60"))  # секунды на запуск сервера шарда
+
+# Многопроцессный режим обслуживания (serve.py): резидентные индексы баз загружаются
+# мастером до fork и разделяются воркерами по принципу copy-on-write
+SERVE_WORKERS = int(os.getenv("WORKERS", os.cpu_count() or 1))
+TORCH_THREADS_PER_WORKER = int(os.getenv("TORCH_THREADS_PER_WORKER", "1"))
+
+# Контроль допуска к /generate_email (в пределах одного воркера)
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "8"))  # 0 — без ограничения
+ADMISSION_QUEUE_SIZE_INTERACTIVE = int(os.getenv("ADMISSION_QUEUE_SIZE_INTERACTIVE", "32"))
+ADMISSION_QUEUE_SIZE_BULK = int(os.getenv("ADMISSION_QUEUE_SIZE_BULK", "16"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10.0"))  # секунды ожидания в очереди
+
+# Дедлайн запроса (deadline_ms): доля остатка бюджета на поиск чанков, размер кэша
+# результатов поиска для деградации и минимальный остаток для вызова LLM
+RETRIEVAL_BUDGET_SHARE = float(os.getenv("RETRIEVAL_BUDGET_SHARE", "0.3"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+DEADLINE_MIN_LLM_SECONDS = float(os.getenv("DEADLINE_MIN_LLM_SECONDS", "1.0"))
+
+# Исполнитель конвейера письма: linear (без LangGraph, по умолчанию) | langgraph
+PIPELINE_EXECUTOR = os.getenv("PIPELINE_EXECUTOR", "linear")
+
+# Максимум вариантов письма за один запрос к /generate_email
+MAX_LETTER_VARIANTS = int(os.getenv("MAX_LETTER_VARIANTS", "5"))
+
+# Логирование
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text | json
+LOG_ASYNC = os.getenv("LOG_ASYNC", "0") == "1"  # запись в stdout фоновым потоком через очередь
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Доля сохраняемых записей ниже WARNING по логгерам, например "chunks=0.1,letter_pipeline=0.5"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
 #API KEY OPEN AI
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
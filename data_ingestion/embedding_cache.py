@@ -0,0 +1,387 @@
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from data_ingestion.config import EMBEDDING_CACHE_DIR, EMBEDDING_MODEL_NAME
+from utils.logger import setup_logger
+
+# Инициализация логгера
+logger = setup_logger("embedding_cache")
+
+VECTORS_FILE = "vectors.f32"
+INDEX_FILE = "index.json"
+LOCK_FILE = "cache.lock"
+
+
+def cache_path(model_name: str, cache_dir: Path = EMBEDDING_CACHE_DIR) -> Path:
+    """Возвращает директорию кэша эмбеддингов для модели."""
+    return Path(cache_dir) / model_name.replace("/", "__")
+
+
+class EmbeddingCache:
+    """
+    Контентно-адресуемый кэш эмбеддингов на диске.
+
+    Ключ записи — хэш текста чанка, кэш разделён по моделям (отдельная
+    директория на модель). Векторы хранятся в одном файле float32,
+    который читается через memory-map, индекс хэш → строка — в JSON.
+
+    Кэш можно открывать из нескольких процессов: запись строк и индекса
+    выполняется под эксклюзивной блокировкой flock, номер строки берётся
+    из фактического размера файла векторов, а индекс перед записью
+    объединяется с версией на диске. Компактизация меняет поколение
+    индекса, и остальные экземпляры перечитывают его целиком.
+
+    Attributes:
+        model_name: Имя модели эмбеддингов.
+        dim: Размерность эмбеддингов.
+        path: Директория кэша для данной модели.
+        hits: Количество попаданий в кэш за время жизни объекта.
+        misses: Количество промахов (текстов, отправленных в модель).
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        dim: Optional[int] = None,
+        cache_dir: Path = EMBEDDING_CACHE_DIR,
+    ) -> None:
+        """
+        Открывает (или создаёт) кэш для указанной модели.
+
+        Args:
+            model_name: Имя модели эмбеддингов.
+            dim: Размерность эмбеддингов. Если не задана, читается из индекса.
+            cache_dir: Корневая директория кэша.
+
+        Raises:
+            ValueError: Если размерность не задана и не найдена в индексе
+                или не совпадает с сохранённой.
+        """
+        self.model_name = model_name
+        self.path = cache_path(model_name, cache_dir)
+        os.makedirs(self.path, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._vectors_path = self.path / VECTORS_FILE
+        self._index_path = self.path / INDEX_FILE
+        self._lock_path = self.path / LOCK_FILE
+        self._mmap: Optional[np.memmap] = None
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+
+        with self._file_lock():
+            # Загрузка индекса хэш → [строка, время последнего использования]
+            meta = self._read_index()
+            stored_dim = meta.get("dim")
+            if dim is None and stored_dim is None:
+                raise ValueError(f"Размерность эмбеддингов для кэша {self.path} неизвестна.")
+            if dim is not None and stored_dim is not None and dim != stored_dim:
+                raise ValueError(
+                    f"Размерность кэша {self.path} ({stored_dim}) не совпадает с моделью ({dim})."
+                )
+            self.dim = int(dim if dim is not None else stored_dim)
+            self._row_bytes = self.dim * np.dtype(np.float32).itemsize
+
+            # Отсечение недописанной строки после аварийного завершения
+            size = self._vectors_path.stat().st_size if self._vectors_path.exists() else 0
+            if size % self._row_bytes:
+                with open(self._vectors_path, "r+b") as f:
+                    f.truncate(size - size % self._row_bytes)
+                size -= size % self._row_bytes
+            self._rows = size // self._row_bytes
+
+            # Записи, ссылающиеся за пределы файла векторов, недействительны
+            self._generation = meta.get("generation", 0)
+            self._entries: Dict[str, List[float]] = {
+                k: v for k, v in meta.get("entries", {}).items() if int(v[0]) < self._rows
+            }
+            self._stamp = self._index_stamp()
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool = True):
+        """Блокировка кэша между процессами (flock на файле cache.lock)."""
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_index(self) -> dict:
+        """Читает индекс с диска (пустой словарь, если индекса нет)."""
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _index_stamp(self) -> Optional[tuple]:
+        """Отпечаток файла индекса: меняется при каждой его перезаписи."""
+        try:
+            stat = self._index_path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _sync(self) -> None:
+        """
+        Объединяет индекс в памяти с индексом на диске (под блокировкой кэша).
+
+        Записи других экземпляров добавляются, время использования берётся
+        наибольшее. Если индекс на диске другого поколения (файл векторов
+        перезаписан компактизацией), прежние номера строк недействительны
+        и индекс заменяется дисковым.
+        """
+        size = self._vectors_path.stat().st_size if self._vectors_path.exists() else 0
+        rows = size // self._row_bytes
+        if rows != self._rows:
+            self._rows = rows
+            self._mmap = None
+
+        stamp = self._index_stamp()
+        if stamp == self._stamp:
+            return
+        meta = self._read_index()
+        disk_entries = meta.get("entries", {})
+        generation = meta.get("generation", 0)
+        if generation != self._generation:
+            self._entries = disk_entries
+            self._generation = generation
+            self._mmap = None
+        else:
+            for key, entry in disk_entries.items():
+                own = self._entries.get(key)
+                if own is None:
+                    self._entries[key] = entry
+                elif entry[1] > own[1]:
+                    own[1] = entry[1]
+        self._entries = {k: v for k, v in self._entries.items() if int(v[0]) < self._rows}
+        self._stamp = stamp
+
+    @staticmethod
+    def text_key(text: str) -> str:
+        """Возвращает хэш текста чанка, используемый как ключ кэша."""
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        """Размер файла векторов в байтах."""
+        return self._rows * self._row_bytes
+
+    def _vectors(self) -> Optional[np.memmap]:
+        """Возвращает memory-map файла векторов (открывается лениво)."""
+        if self._mmap is None and self._rows:
+            self._mmap = np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self.dim)
+            )
+        return self._mmap
+
+    def encode(
+        self,
+        texts: Sequence[str],
+        embedder: SentenceTransformer,
+        **encode_kwargs,
+    ) -> np.ndarray:
+        """
+        Возвращает эмбеддинги текстов, кодируя моделью только промахи кэша.
+
+        Args:
+            texts: Тексты чанков.
+            embedder: Модель эмбеддингов.
+            **encode_kwargs: Дополнительные параметры для embedder.encode.
+
+        Returns:
+            Массив float32 формы (len(texts), dim) в порядке входных текстов.
+        """
+        keys = [self.text_key(text) for text in texts]
+        result = np.empty((len(texts), self.dim), dtype=np.float32)
+        now = time.time()
+
+        with self._lock, self._file_lock(exclusive=False):
+            self._sync()
+
+            # Поиск попаданий и векторное чтение строк из memory-map
+            hit_positions, hit_rows = [], []
+            missing: Dict[str, List[int]] = {}
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is None:
+                    missing.setdefault(key, []).append(i)
+                else:
+                    entry[1] = now
+                    hit_positions.append(i)
+                    hit_rows.append(int(entry[0]))
+
+            if hit_rows:
+                result[hit_positions] = self._vectors()[hit_rows]
+                self._dirty = True
+            self.hits += len(hit_rows)
+
+        if not missing:
+            return result
+
+        # Кодирование только промахов (дубликаты внутри вызова кодируются один раз)
+        miss_texts = [texts[positions[0]] for positions in missing.values()]
+        encoded = np.asarray(embedder.encode(miss_texts, **encode_kwargs), dtype=np.float32)
+
+        with self._lock:
+            self._append(list(missing.keys()), encoded, now)
+            self.misses += len(miss_texts)
+
+        for row, positions in zip(encoded, missing.values()):
+            result[positions] = row
+        return result
+
+    def _append(self, keys: List[str], vectors: np.ndarray, now: float) -> None:
+        """
+        Дописывает новые векторы в конец файла и сохраняет индекс.
+
+        Номер первой строки берётся из фактического размера файла под
+        блокировкой: другие экземпляры могли дописать свои строки.
+        """
+        with self._file_lock():
+            self._sync()
+            with open(self._vectors_path, "ab") as f:
+                size = f.seek(0, os.SEEK_END)
+                # Недописанная строка после аварийного завершения другого процесса
+                if size % self._row_bytes:
+                    size -= size % self._row_bytes
+                    f.truncate(size)
+                first_row = size // self._row_bytes
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+
+            for offset, key in enumerate(keys):
+                self._entries[key] = [first_row + offset, now]
+            self._rows = first_row + len(keys)
+
+            # Файл вырос — memory-map будет переоткрыт при следующем чтении
+            self._mmap = None
+            self._write_index()
+            self._dirty = False
+
+    def flush(self) -> None:
+        """Атомарно сохраняет индекс кэша на диск, объединяя его с дисковой версией."""
+        with self._lock:
+            if not self._dirty:
+                return
+            with self._file_lock():
+                self._sync()
+                self._write_index()
+            self._dirty = False
+
+    def _write_index(self) -> None:
+        tmp_path = self._index_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "model": self.model_name,
+                    "dim": self.dim,
+                    "generation": self._generation,
+                    "entries": self._entries,
+                },
+                f,
+            )
+        os.replace(tmp_path, self._index_path)
+        self._stamp = self._index_stamp()
+
+    def compact(
+        self,
+        max_entries: Optional[int] = None,
+        max_age_days: Optional[float] = None,
+    ) -> int:
+        """
+        Удаляет устаревшие записи и освобождает место в файле векторов.
+
+        Сначала отбрасываются записи, не использовавшиеся дольше max_age_days,
+        затем остаются только max_entries самых недавно использованных.
+        Осиротевшие строки (без записи в индексе) удаляются всегда.
+
+        Args:
+            max_entries: Максимальное число записей после компактизации.
+            max_age_days: Максимальный возраст записи с последнего использования.
+
+        Returns:
+            Количество удалённых записей.
+        """
+        with self._lock, self._file_lock():
+            self._sync()
+            entries = sorted(self._entries.items(), key=lambda item: item[1][1], reverse=True)
+            if max_age_days is not None:
+                threshold = time.time() - max_age_days * 86400
+                entries = [item for item in entries if item[1][1] >= threshold]
+            if max_entries is not None:
+                entries = entries[:max_entries]
+
+            removed = len(self._entries) - len(entries)
+
+            # Перезапись файла векторов только с сохранёнными строками
+            entries.sort(key=lambda item: item[1][0])
+            tmp_path = self._vectors_path.with_suffix(".tmp")
+            vectors = self._vectors()
+            with open(tmp_path, "wb") as f:
+                for start in range(0, len(entries), 4096):
+                    rows = [int(entry[0]) for _, entry in entries[start : start + 4096]]
+                    f.write(np.ascontiguousarray(vectors[rows]).tobytes())
+
+            self._mmap = None
+            del vectors
+            os.replace(tmp_path, self._vectors_path)
+
+            self._entries = {key: [row, entry[1]] for row, (key, entry) in enumerate(entries)}
+            self._rows = len(entries)
+            self._generation += 1
+            self._write_index()
+            self._dirty = False
+
+        logger.info(f"🧹 Кэш эмбеддингов {self.path} сжат: удалено {removed}, осталось {self._rows}.")
+        return removed
+
+
+def open_embedding_cache(embedder: SentenceTransformer, model_name: str = EMBEDDING_MODEL_NAME) -> EmbeddingCache:
+    """
+    Открывает кэш эмбеддингов для загруженной модели.
+
+    Args:
+        embedder: Модель эмбеддингов (используется для определения размерности).
+        model_name: Имя модели, по которому разделяется кэш.
+
+    Returns:
+        Объект EmbeddingCache.
+    """
+    return EmbeddingCache(model_name, embedder.get_sentence_embedding_dimension())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Обслуживание кэша эмбеддингов")
+    parser.add_argument("command", choices=["stats", "compact"])
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--max-entries", type=int, default=None)
+    parser.add_argument("--max-age-days", type=float, default=None)
+    args = parser.parse_args()
+
+    # Пустой кэш: размерность неизвестна, обслуживать нечего
+    if not (cache_path(args.model) / INDEX_FILE).exists():
+        logger.info(f"Кэш {cache_path(args.model)} пуст.")
+    else:
+        cache = EmbeddingCache(args.model)
+        if args.command == "compact":
+            cache.compact(max_entries=args.max_entries, max_age_days=args.max_age_days)
+        logger.info(
+            f"Кэш {cache.path}: {len(cache)} записей, "
+            f"{cache.nbytes / 1024**2:.2f} МБ векторов."
+        )
@@ -1,151 +1,520 @@
-from typing import List
+import queue
+import shutil
+import threading
+import time
+from typing import Iterator, List, Optional
 import psutil
+import torch
 
 from llama_index.core import Document
 from llama_index.core.node_parser import SentenceSplitter
 
 from sentence_transformers import SentenceTransformer
 
-from data_ingestion.loader import read_pdf_document, read_md_documents
-from utils.chroma_client import get_chroma_collection, get_chroma_client
-from utils.logger import setup_logger
+from data_ingestion.ann_index import ann_index_path, build_ann_index
+from data_ingestion.embedding_cache import open_embedding_cache
+from data_ingestion.loader import iter_pdf_pages, read_md_documents
+from data_ingestion.memory_budget import END, MemoryBudget, StageStats, format_stage_report, get, put, text_bytes
+from data_ingestion.shards import build_shards, shard_index_path
+from utils.chroma_client import get_chroma_collection, get_chroma_client, collection_name_for
+from utils.collection_aliases import alias_versions, rollback_alias, swap_alias
+from utils.logger import RSS_MB, setup_logger
 from .config import (
     PROCESSED_DATA_DIR,
     PDF_PATH,
+    TENANT_DATA_DIR,
     CHUNK_SIZE,
     CHUNK_OVERLAP,
     EMBEDDING_MODEL_NAME,
+    EMBEDDING_CACHE_ENABLED,
+    ANN_INDEX_ENABLED,
+    KB_KEEP_VERSIONS,
+    INGEST_WRITE_BATCH_SIZE,
+    KB_SHARDS,
+    EMBED_BATCH_SIZE,
+    EMBED_BUFFER_SIZE,
+    INGEST_RSS_BUDGET_MB,
+    INGEST_QUEUE_SIZE,
 )
 
 # Инициализация логгера
 logger = setup_logger("chroma")
 
 
+def embedding_batch_size() -> int:
+    """
+    Размер батча модели эмбеддингов: EMBED_BATCH_SIZE или подбор по числу потоков.
+
+    На CPU крупный батч загружает все потоки torch матричными операциями,
+    а паддинг остаётся малым благодаря сортировке чанков по длине.
+    """
+    if EMBED_BATCH_SIZE:
+        return EMBED_BATCH_SIZE
+    return int(min(256, max(32, 32 * torch.get_num_threads())))
+
+
 class KnowledgeBaseBuilder:
-    def __init__(self) -> None:
-        """Инициализирует ChromaDB клиент и модель эмбеддингов."""
+    def __init__(
+        self,
+        knowledge_base_id: Optional[str] = None,
+        shards: int = KB_SHARDS,
+        rss_budget_mb: int = INGEST_RSS_BUDGET_MB,
+    ) -> None:
+        """
+        Инициализирует ChromaDB клиент и модель эмбеддингов.
+
+        Args:
+            knowledge_base_id: Идентификатор базы знаний продуктовой линии.
+                None — основная база (статьи из архива и PDF).
+            shards: Количество шардов для серверов поиска (0 или 1 — без шардов).
+            rss_budget_mb: Бюджет RSS потоковой сборки в МБ (0 — сборка без бюджета).
+        """
+        self.knowledge_base_id = knowledge_base_id
+        self.shards = shards
+        self.rss_budget_mb = rss_budget_mb
+        self.stage_stats: List[StageStats] = []
+
+        # Источники документов базы знаний
+        if knowledge_base_id:
+            self.md_dir = TENANT_DATA_DIR / knowledge_base_id
+            self.pdf_paths = sorted(self.md_dir.glob("*.pdf"))
+        else:
+            self.md_dir = PROCESSED_DATA_DIR
+            self.pdf_paths = [PDF_PATH]
 
         #Инициализация клиента Chroma DB
         self.client = get_chroma_client()
 
-        # Получение или создание коллекции ChromaDB
-        self.collection = get_chroma_collection(self.client)
+        # Логическое имя базы: псевдоним, указывающий на текущую версию коллекции
+        self.alias = collection_name_for(knowledge_base_id)
+
+        # Коллекция новой версии создаётся при запуске ingest
+        self.collection = None
+        self.write_batch_size = min(INGEST_WRITE_BATCH_SIZE, self.client.get_max_batch_size())
+        self._pending = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
 
         # Загрузка модели для создания эмбеддингов
         self.embedder = SentenceTransformer(EMBEDDING_MODEL_NAME)
 
-    def chunk_document(self, doc: Document) -> List[Document]:
+        # Кэш эмбеддингов: неизменённые чанки не кодируются повторно
+        self.embedding_cache = open_embedding_cache(self.embedder) if EMBEDDING_CACHE_ENABLED else None
+
+        # Параметры кодирования: общий буфер чанков и размер батча модели
+        self.embed_buffer_size = EMBED_BUFFER_SIZE
+        self.embed_batch_size = embedding_batch_size()
+        self.embed_seconds = 0.0
+        self.failed_chunks = 0
+
+        # Разделитель текста на чанки (общий для всех документов)
+        self.splitter = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+    def embed(self, texts: List[str]):
         """
-        Разбивает документ на чанки фиксированного размера.
+        Создаёт эмбеддинги для списка текстов, используя кэш при наличии.
+
+        SentenceTransformer.encode сортирует тексты внутри вызова по длине,
+        делит их на батчи embed_batch_size и возвращает эмбеддинги в исходном
+        порядке, поэтому батчи состоят из чанков близкой длины и паддинг минимален.
 
         Args:
-            doc: Объект Document для разбиения.
+            texts: Тексты чанков.
 
         Returns:
-            Список объектов Document, каждый из которых содержит чанк текста и метаданные.
+            Массив эмбеддингов в порядке входных текстов.
         """
-        # Инициализация разделителя текста на чанки
-        splitter = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        if self.embedding_cache is None:
+            return self.embedder.encode(texts, batch_size=self.embed_batch_size)
+        return self.embedding_cache.encode(texts, self.embedder, batch_size=self.embed_batch_size)
 
-        # Разбиение текста на чанки
-        chunks = splitter.split_text(doc.text)
+    def _buffer_add(self, ids: List[str], documents: List[str], metadatas: List[dict], embeddings) -> None:
+        """Накапливает чанки и пишет их в коллекцию крупными пакетами."""
+        self._pending["ids"].extend(ids)
+        self._pending["documents"].extend(documents)
+        self._pending["metadatas"].extend(metadatas)
+        self._pending["embeddings"].extend(embeddings)
+        if len(self._pending["ids"]) >= self.write_batch_size:
+            self._flush_writes()
 
-        # Создание объектов Document для каждого чанка
-        return [Document(text=chunk, metadata=doc.metadata) for chunk in chunks]
+    def _flush_writes(self) -> None:
+        """Записывает накопленные чанки в коллекцию новой версии."""
+        if not self._pending["ids"]:
+            return
+        try:
+            self.collection.add(**self._pending)
+        except Exception as e:
+            # Потерянные чанки не пройдут проверку количества при валидации
+            logger.error(f"Ошибка при добавлении в ChromaDB: {e}")
+        self._pending = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
 
-    def ingest(self) -> None:
-        """Загружает документы в ChromaDB, разбивая их на чанки и создавая эмбеддинги."""
-        # Подсчет общего количества обработанных чанков
-        total_chunks = 0
-        batch_size = 100  # Размер батча для обработки эмбеддингов
+    def validate(self, expected_count: int) -> bool:
+        """
+        Проверяет новую версию коллекции перед переключением на неё.
+
+        Args:
+            expected_count: Количество чанков, отправленных на запись.
+
+        Returns:
+            True, если версия полна и поиск по ней работает.
+        """
+        count = self.collection.count()
+        if count == 0 or count != expected_count:
+            logger.error(f"❌ Валидация не пройдена: в коллекции {count} чанков, ожидалось {expected_count}.")
+            return False
 
-        # Обработка .md документов по одному через итератор
-        for doc in read_md_documents(PROCESSED_DATA_DIR):
+        # Контрольный запрос: чанк должен находиться по собственному эмбеддингу
+        sample = self.collection.get(limit=1, include=["embeddings"])
+        embedding = sample["embeddings"][0]
+        if len(embedding) != self.embedder.get_sentence_embedding_dimension():
+            logger.error("❌ Валидация не пройдена: размерность эмбеддингов не совпадает с моделью.")
+            return False
+        result = self.collection.query(query_embeddings=[embedding], n_results=1)
+        if not result["distances"][0] or result["distances"][0][0] > 1e-3:
+            logger.error("❌ Валидация не пройдена: контрольный запрос не нашёл чанк.")
+            return False
+        return True
+
+    def _promote(self) -> None:
+        """Атомарно переключает псевдоним на новую версию и удаляет устаревшие версии."""
+        # Коллекция без версии (созданная до сине-зелёных пересборок) сохраняется для отката
+        legacy = None
+        if not alias_versions(self.alias):
             try:
-                # Разбиение документа на чанки
-                doc_chunks = self.chunk_document(doc)
-                chunks = [chunk.text for chunk in doc_chunks]
-                metadatas = [chunk.metadata for chunk in doc_chunks]
-
-                # Обработка чанков батчами
-                for i in range(0, len(chunks), batch_size):
-                    batch_chunks = chunks[i : i + batch_size]
-                    batch_metadatas = metadatas[i : i + batch_size]
-
-                    # Создание эмбеддингов для батча
-                    try:
-                        batch_embeddings = self.embedder.encode(batch_chunks)
-                        logger.info(
-                            f"Потребление памяти после создания эмбеддингов: "
-                            f"{psutil.Process().memory_info().rss / 1024**2:.2f} МБ"
-                        )
-                    except Exception as e:
-                        logger.error(f"Ошибка при создании эмбеддингов: {e}")
-                        continue
-
-                    # Добавление батча в ChromaDB
-                    try:
-                        self.collection.add(
-                            documents=batch_chunks,
-                            metadatas=batch_metadatas,
-                            embeddings=batch_embeddings,
-                            ids=[f"doc_{total_chunks + j}" for j in range(len(batch_chunks))],
-                        )
-                        total_chunks += len(batch_chunks)
-
-                    except Exception as e:
-                        logger.error(f"Ошибка при добавлении в ChromaDB: {e}")
-
-                    # Очистка памяти
-                    del batch_chunks, batch_metadatas, batch_embeddings
+                if self.client.get_collection(self.alias).count() > 0:
+                    legacy = self.alias
+                else:
+                    self.client.delete_collection(self.alias)
+            except Exception:
+                pass
+
+        dropped = swap_alias(self.alias, self.collection.name, KB_KEEP_VERSIONS, previous=legacy)
+        logger.info(f"🔀 Псевдоним '{self.alias}' переключён на '{self.collection.name}'.")
 
+        for name in dropped:
+            try:
+                self.client.delete_collection(name)
+                shutil.rmtree(ann_index_path(name), ignore_errors=True)
+                shutil.rmtree(shard_index_path(name), ignore_errors=True)
+                logger.info(f"Удалена устаревшая версия '{name}'.")
             except Exception as e:
-                logger.error(f"Ошибка при обработке документа: {e}")
+                logger.error(f"Ошибка при удалении версии '{name}': {e}")
+
+    def iter_documents(self) -> Iterator[Document]:
+        """Возвращает документы базы знаний по одному: статьи .md, затем страницы PDF."""
+        yield from read_md_documents(self.md_dir)
+        for pdf_path in self.pdf_paths:
+            yield from iter_pdf_pages(pdf_path)
+
+    def _embed_and_buffer(self, texts: List[str], metadatas: List[dict], first_id: int) -> int:
+        """
+        Кодирует накопленные чанки одним вызовом модели и передаёт их в буфер записи.
 
-        # Обработка PDF-документа
+        Args:
+            texts: Тексты чанков.
+            metadatas: Метаданные чанков.
+            first_id: Номер первого чанка (для идентификаторов doc_<n>).
+
+        Returns:
+            Количество чанков, переданных на запись.
+
+        Raises:
+            RuntimeError: Если кодирование не удалось — версия была бы неполной.
+        """
         try:
-            pdf_doc = read_pdf_document(PDF_PATH)
-            doc_chunks = self.chunk_document(pdf_doc)
-            chunks = [chunk.text for chunk in doc_chunks]
-            metadatas = [chunk.metadata for chunk in doc_chunks]
+            start_time = time.perf_counter()
+            embeddings = self.embed(texts)
+            self.embed_seconds += time.perf_counter() - start_time
+            logger.info("Потребление памяти после создания эмбеддингов: %s МБ", RSS_MB)
+        except Exception as e:
+            self.failed_chunks += len(texts)
+            raise RuntimeError(f"ошибка при создании эмбеддингов ({len(texts)} чанков не закодированы): {e}") from e
 
-            # Обработка чанков PDF батчами
-            for i in range(0, len(chunks), batch_size):
-                batch_chunks = chunks[i : i + batch_size]
-                batch_metadatas = metadatas[i : i + batch_size]
+        self._buffer_add([f"doc_{first_id + j}" for j in range(len(texts))], texts, metadatas, embeddings)
+        return len(texts)
+
+    def _ingest_buffered(self) -> int:
+        """
+        Собирает чанки всех документов в общем буфере и кодирует их крупными вызовами модели.
+
+        Returns:
+            Количество чанков, переданных на запись.
+        """
+        # Подсчет общего количества обработанных чанков
+        total_chunks = 0
+
+        # Общий буфер чанков между документами: короткие статьи не кодируются крошечными батчами
+        buffer_texts: List[str] = []
+        buffer_metadatas: List[dict] = []
+
+        for doc in self.iter_documents():
+            try:
+                # Разбиение документа на чанки (тексты без промежуточных Document)
+                for text in self.splitter.split_text(doc.text):
+                    buffer_texts.append(text)
+                    buffer_metadatas.append(doc.metadata)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке документа {doc.metadata.get('source')}: {e}")
 
-                # Создание эмбеддингов для батча
+            if len(buffer_texts) >= self.embed_buffer_size:
+                total_chunks += self._embed_and_buffer(buffer_texts, buffer_metadatas, total_chunks)
+                buffer_texts, buffer_metadatas = [], []
+
+        if buffer_texts:
+            total_chunks += self._embed_and_buffer(buffer_texts, buffer_metadatas, total_chunks)
+
+        # Запись остатка буфера
+        self._flush_writes()
+        return total_chunks
+
+    def _ingest_streaming(self) -> int:
+        """
+        Потоковая сборка с бюджетом RSS: чтение → разбиение → кодирование → запись.
+
+        Стадии работают в отдельных потоках и связаны очередями длиной
+        INGEST_QUEUE_SIZE: медленная стадия блокирует предыдущие (обратное
+        давление), поэтому в памяти одновременно находится ограниченное число
+        документов и батчей. Чтение нового документа приостанавливается, пока
+        RSS выше порога бюджета. По завершении логируются пики данных, которые
+        каждая стадия держит в обработке и в своей очереди, и пик RSS процесса.
+        Ошибка любой стадии (в том числе кодирования батча) прерывает сборку.
+
+        Returns:
+            Количество чанков, переданных на запись.
+
+        Raises:
+            RuntimeError: Если одна из стадий завершилась ошибкой.
+        """
+        budget = MemoryBudget(self.rss_budget_mb * 1024**2)
+        stop = threading.Event()
+        errors: List[str] = []
+        documents_queue: queue.Queue = queue.Queue(INGEST_QUEUE_SIZE)
+        chunks_queue: queue.Queue = queue.Queue(INGEST_QUEUE_SIZE)
+        embedded_queue: queue.Queue = queue.Queue(INGEST_QUEUE_SIZE)
+        queues = (documents_queue, chunks_queue, embedded_queue)
+        load_stats, chunk_stats, embed_stats, write_stats = (
+            StageStats(name) for name in ("load", "chunk", "embed", "write")
+        )
+        self.stage_stats = [load_stats, chunk_stats, embed_stats, write_stats]
+
+        def pipeline_idle() -> bool:
+            return all(stage_queue.empty() for stage_queue in queues)
+
+        def load() -> None:
+            documents = self.iter_documents()
+            while True:
+                # Обратное давление по памяти: новый документ читается только в пределах бюджета
+                load_stats.paused_seconds += budget.wait(pipeline_idle, stop)
+                start_time = time.perf_counter()
+                doc = next(documents, END)
+                load_stats.busy_seconds += time.perf_counter() - start_time
+                if doc is END:
+                    break
+                doc_bytes = text_bytes([doc.text])
+                load_stats.hold(doc_bytes)
+                if not put(documents_queue, doc, load_stats, stop, doc_bytes):
+                    break
+                load_stats.items += 1
+            put(documents_queue, END, load_stats, stop)
+
+        def chunk() -> None:
+            texts: List[str] = []
+            metadatas: List[dict] = []
+            batch_bytes = 0
+            while True:
+                doc, doc_bytes = get(documents_queue, chunk_stats, stop)
+                if doc is END:
+                    break
+                start_time = time.perf_counter()
                 try:
-                    batch_embeddings = self.embedder.encode(batch_chunks)
-                    logger.info(
-                        f"Потребление памяти после создания эмбеддингов для PDF: "
-                        f"{psutil.Process().memory_info().rss / 1024**2:.2f} МБ"
-                    )
+                    doc_texts = self.splitter.split_text(doc.text)
+                    texts.extend(doc_texts)
+                    metadatas.extend([doc.metadata] * len(doc_texts))
+                    chunks_bytes = text_bytes(doc_texts)
+                    chunk_stats.hold(chunks_bytes)
+                    batch_bytes += chunks_bytes
                 except Exception as e:
-                    logger.error(f"Ошибка при создании эмбеддингов для PDF: {e}")
-                    continue
+                    logger.error(f"Ошибка при обработке документа {doc.metadata.get('source')}: {e}")
+                chunk_stats.busy_seconds += time.perf_counter() - start_time
+                chunk_stats.items += 1
+                chunk_stats.release(doc_bytes)
+                del doc
+
+                if len(texts) >= self.embed_buffer_size:
+                    if not put(chunks_queue, (texts, metadatas), chunk_stats, stop, batch_bytes):
+                        return
+                    texts, metadatas, batch_bytes = [], [], 0
+            if texts:
+                put(chunks_queue, (texts, metadatas), chunk_stats, stop, batch_bytes)
+            put(chunks_queue, END, chunk_stats, stop)
 
-                # Добавление батча в ChromaDB
+        def embed() -> None:
+            first_id = 0
+            while True:
+                batch, batch_bytes = get(chunks_queue, embed_stats, stop)
+                if batch is END:
+                    break
+                texts, metadatas = batch
+                start_time = time.perf_counter()
                 try:
-                    self.collection.add(
-                        documents=batch_chunks,
-                        metadatas=batch_metadatas,
-                        embeddings=batch_embeddings,
-                        ids=[f"doc_{total_chunks + j}" for j in range(len(batch_chunks))],
-                    )
-                    total_chunks += len(batch_chunks)
-                except Exception as e:
-                    logger.error(f"Ошибка при добавлении PDF в ChromaDB: {e}")
+                    embeddings = self.embed(texts)
+                except Exception:
+                    # Незакодированный батч делает версию неполной: сборка прерывается
+                    embed_stats.failed_items += len(texts)
+                    self.failed_chunks += len(texts)
+                    raise
+                finally:
+                    elapsed = time.perf_counter() - start_time
+                    embed_stats.busy_seconds += elapsed
+                    self.embed_seconds += elapsed
+                embed_stats.items += len(texts)
+                embed_stats.hold(embeddings.nbytes)
+
+                ids = [f"doc_{first_id + j}" for j in range(len(texts))]
+                first_id += len(texts)
+                batch_bytes += embeddings.nbytes
+                if not put(embedded_queue, (ids, texts, metadatas, embeddings), embed_stats, stop, batch_bytes):
+                    return
+                del batch, texts, metadatas, embeddings
+            put(embedded_queue, END, embed_stats, stop)
+
+        def run_stage(stage) -> None:
+            try:
+                stage()
+            except Exception as e:
+                errors.append(f"{stage.__name__}: {e}")
+                logger.error(f"Ошибка стадии '{stage.__name__}' потоковой сборки: {e}", exc_info=True)
+                stop.set()
+
+        threads = [
+            threading.Thread(target=run_stage, args=(stage,), name=f"ingest-{stage.__name__}", daemon=True)
+            for stage in (load, chunk, embed)
+        ]
+        for thread in threads:
+            thread.start()
+
+        # Запись в ChromaDB — в текущем потоке
+        total_chunks = 0
+        pending_bytes = 0  # данные в буфере записи до очередного пакета в коллекцию
+        try:
+            while True:
+                batch, batch_bytes = get(embedded_queue, write_stats, stop)
+                if batch is END:
+                    break
+                start_time = time.perf_counter()
+                pending_bytes += batch_bytes
+                self._buffer_add(*batch)
+                if not self._pending["ids"]:
+                    write_stats.release(pending_bytes)
+                    pending_bytes = 0
+                total_chunks += len(batch[0])
+                write_stats.busy_seconds += time.perf_counter() - start_time
+                write_stats.items += len(batch[0])
+                budget.sample()
+                del batch
+            start_time = time.perf_counter()
+            self._flush_writes()
+            write_stats.release(pending_bytes)
+            write_stats.busy_seconds += time.perf_counter() - start_time
+            budget.sample()
+        except Exception as e:
+            errors.append(f"write: {e}")
+            stop.set()
+        finally:
+            for thread in threads:
+                thread.join()
+
+        logger.info("Потоковая сборка, память по стадиям:\n%s", format_stage_report(self.stage_stats, budget))
+        if errors:
+            raise RuntimeError("; ".join(errors))
+        return total_chunks
+
+    def ingest(self) -> None:
+        """
+        Строит новую версию базы знаний и атомарно переключает на неё поиск.
 
-                # Очистка памяти
-                del batch_chunks, batch_metadatas, batch_embeddings
+        Документы разбиваются на чанки и записываются в отдельную коллекцию
+        <псевдоним>__v<время>, пока поиск продолжает читать текущую версию.
+        Чанки всех документов (.md и PDF) накапливаются в общем буфере и
+        кодируются крупными вызовами модели; при заданном бюджете RSS сборка
+        идёт потоково (_ingest_streaming). После валидации псевдоним
+        переключается на новую версию, предыдущая сохраняется для отката.
+        """
+        version = f"{self.alias}__v{time.strftime('%Y%m%d%H%M%S')}{int(time.time() * 1000) % 1000:03d}"
+        self.collection = get_chroma_collection(self.client, version)
+        logger.info(f"Сборка новой версии базы знаний '{version}'.")
+        start_time = time.perf_counter()
 
+        try:
+            total_chunks = self._ingest_streaming() if self.rss_budget_mb else self._ingest_buffered()
         except Exception as e:
-            logger.error(f"Ошибка при обработке PDF {PDF_PATH}: {e}")
+            self.client.delete_collection(version)
+            logger.error(f"❌ Ошибка сборки, версия '{version}' отклонена, псевдоним '{self.alias}' не изменён: {e}")
+            return
+
+        # Пропускная способность кодирования
+        logger.info(
+            f"Кодирование: {total_chunks} чанков за {self.embed_seconds:.2f} секунд "
+            f"({total_chunks / max(self.embed_seconds, 1e-9):.1f} чанков/с, батч {self.embed_batch_size}), "
+            f"сборка: {time.perf_counter() - start_time:.2f} секунд."
+        )
+
+        # Сохранение индекса кэша эмбеддингов
+        if self.embedding_cache is not None:
+            self.embedding_cache.flush()
+            logger.info(
+                f"Кэш эмбеддингов: попаданий {self.embedding_cache.hits}, "
+                f"промахов {self.embedding_cache.misses}."
+            )
+
+        # Проверка новой версии: при ошибке текущая версия продолжает обслуживать поиск
+        if not self.validate(total_chunks):
+            self.client.delete_collection(version)
+            logger.error(f"❌ Версия '{version}' отклонена, псевдоним '{self.alias}' не изменён.")
+            return
+
+        # Построение приближённого индекса новой версии до переключения
+        if ANN_INDEX_ENABLED:
+            try:
+                build_ann_index(self.collection)
+            except Exception as e:
+                logger.error(f"Ошибка при построении ANN-индекса: {e}")
+
+        # Разбиение новой версии на шарды до переключения
+        if self.shards > 1:
+            try:
+                build_shards(self.collection, self.shards)
+            except Exception as e:
+                self.client.delete_collection(version)
+                shutil.rmtree(ann_index_path(version), ignore_errors=True)
+                logger.error(f"❌ Ошибка при разбиении на шарды, версия '{version}' отклонена: {e}")
+                return
+
+        self._promote()
 
         # Логирование итогового потребления памяти и количества чанков
         logger.info(
             f"Итоговое потребление памяти: "
             f"{psutil.Process().memory_info().rss / 1024**2:.2f} МБ"
         )
-        logger.info(f"✅ Загружено в коллекцию {total_chunks} чанков.")
\ No newline at end of file
+        logger.info(f"✅ Загружено в коллекцию {total_chunks} чанков.")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Построение базы знаний")
+    parser.add_argument("--kb", default=None, help="Идентификатор базы знаний (data/tenants/<kb>)")
+    parser.add_argument("--rollback", action="store_true", help="Вернуть предыдущую версию базы")
+    parser.add_argument("--versions", action="store_true", help="Показать версии базы")
+    parser.add_argument("--shards", type=int, default=KB_SHARDS, help="Количество шардов (0 — без шардов)")
+    parser.add_argument(
+        "--rss-budget-mb", type=int, default=INGEST_RSS_BUDGET_MB, help="Бюджет RSS потоковой сборки, МБ (0 — без бюджета)"
+    )
+    args = parser.parse_args()
+
+    alias = collection_name_for(args.kb)
+    if args.rollback:
+        logger.info(f"↩️ Псевдоним '{alias}' возвращён на '{rollback_alias(alias)}'.")
+    elif args.versions:
+        logger.info(f"Версии '{alias}' (от новых к старым): {alias_versions(alias)}")
+    else:
+        KnowledgeBaseBuilder(args.kb, shards=args.shards, rss_budget_mb=args.rss_budget_mb).ingest()
@@ -4,6 +4,11 @@ import pdfplumber
 from llama_index.readers.file import MarkdownReader
 from llama_index.core.schema import Document
 
+from utils.logger import setup_logger
+
+# Инициализация логгера
+logger = setup_logger("loader")
+
 def read_md_documents(dir_path: str) -> Iterator[Document]:
     """
     Загружает все .md-файлы из указанной директории с помощью MarkdownReader.
@@ -62,4 +67,27 @@ def read_pdf_document(pdf_path: str) -> Document:
 
     except Exception as e:
         logger.error(f"Ошибка при чтении PDF {pdf_path}: {e}", exc_info=True)
-        return Document(text="", metadata={"source": os.path.basename(pdf_path), "error": str(e)})
\ No newline at end of file
+        return Document(text="", metadata={"source": os.path.basename(pdf_path), "error": str(e)})
+
+
+def iter_pdf_pages(pdf_path: str) -> Iterator[Document]:
+    """
+    Извлекает текст PDF постранично, не удерживая в памяти весь текст.
+
+    Args:
+        pdf_path: Путь к PDF-файлу.
+
+    Returns:
+        Итератор Document — по одному на непустую страницу.
+    """
+    source = os.path.basename(pdf_path)
+    try:
+        with pdfplumber.open(pdf_path) as pdf:
+            for number, page in enumerate(pdf.pages, start=1):
+                text = page.extract_text() or ""
+                # Освобождение разобранных объектов страницы
+                page.close()
+                if text.strip():
+                    yield Document(text=text, metadata={"source": source, "page": number})
+    except Exception as e:
+        logger.error(f"Ошибка при чтении PDF {pdf_path}: {e}", exc_info=True)
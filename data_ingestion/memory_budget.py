@@ -0,0 +1,225 @@
+import gc
+import queue
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+import psutil
+
+from utils.logger import setup_logger
+
+# Инициализация логгера
+logger = setup_logger("chroma")
+
+# Маркер конца потока данных между стадиями
+END = object()
+
+
+def current_rss() -> int:
+    """Текущий RSS процесса в байтах."""
+    return psutil.Process().memory_info().rss
+
+
+def text_bytes(texts: Iterable[str]) -> int:
+    """Память, занимаемая строками (объекты str целиком)."""
+    return sum(sys.getsizeof(text) for text in texts)
+
+
+class StageStats:
+    """
+    Статистика стадии потоковой сборки.
+
+    Память стадии — байты данных (документов, текстов чанков, эмбеддингов),
+    которые стадия держит в обработке (held) и которые она уже отдала в свою
+    выходную очередь, но следующая стадия ещё не забрала (queued).
+
+    Attributes:
+        name: Имя стадии.
+        items: Количество обработанных элементов.
+        failed_items: Количество элементов, потерянных из-за ошибки стадии.
+        held_bytes: Данные в обработке стадии сейчас.
+        queued_bytes: Данные в выходной очереди стадии сейчас.
+        peak_held_bytes: Пик данных в обработке.
+        peak_queued_bytes: Пик данных в выходной очереди.
+        busy_seconds: Время обработки элементов.
+        blocked_seconds: Время ожидания места в очереди следующей стадии.
+        paused_seconds: Время паузы чтения из-за бюджета памяти.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.items = 0
+        self.failed_items = 0
+        self.held_bytes = 0
+        self.queued_bytes = 0
+        self.peak_held_bytes = 0
+        self.peak_queued_bytes = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.paused_seconds = 0.0
+        # Очередь стадии пополняет её поток, а разбирает поток следующей стадии
+        self._lock = threading.Lock()
+
+    def hold(self, nbytes: int) -> None:
+        """Учитывает данные, взятые стадией в обработку."""
+        with self._lock:
+            self.held_bytes += nbytes
+            self.peak_held_bytes = max(self.peak_held_bytes, self.held_bytes)
+
+    def release(self, nbytes: int) -> None:
+        """Снимает учёт данных, которые стадия больше не держит."""
+        with self._lock:
+            self.held_bytes -= nbytes
+
+    def enqueue(self, nbytes: int) -> None:
+        """Переносит данные из обработки в выходную очередь стадии."""
+        with self._lock:
+            self.held_bytes -= nbytes
+            self.queued_bytes += nbytes
+            self.peak_queued_bytes = max(self.peak_queued_bytes, self.queued_bytes)
+
+    def dequeue(self, nbytes: int) -> None:
+        """Снимает учёт данных, которые следующая стадия забрала из очереди."""
+        with self._lock:
+            self.queued_bytes -= nbytes
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "items": self.items,
+            "failed_items": self.failed_items,
+            "peak_held_mb": round(self.peak_held_bytes / 1024**2, 1),
+            "peak_queued_mb": round(self.peak_queued_bytes / 1024**2, 1),
+            "busy_seconds": round(self.busy_seconds, 2),
+            "blocked_seconds": round(self.blocked_seconds, 2),
+            "paused_seconds": round(self.paused_seconds, 2),
+        }
+
+
+class MemoryBudget:
+    """
+    Бюджет RSS для потоковой сборки базы знаний.
+
+    Чтение новых документов приостанавливается, когда RSS приближается
+    к бюджету (high_watermark), пока последующие стадии не разберут свои
+    очереди. Если очереди пусты, а RSS всё ещё выше порога и после сборки
+    мусора (память не вернулась ОС или бюджет ниже базового RSS с моделью),
+    чтение продолжается по одному документу: следующий читается, когда
+    предыдущие покинули очереди.
+
+    Attributes:
+        budget_bytes: Бюджет RSS процесса в байтах.
+        high_watermark: Доля бюджета, при достижении которой чтение приостанавливается.
+        peak_rss: Наибольший замеренный RSS процесса за сборку.
+    """
+
+    def __init__(self, budget_bytes: int, high_watermark: float = 0.9) -> None:
+        self.budget_bytes = budget_bytes
+        self.high_watermark = high_watermark
+        self.exceeded = False
+        self.peak_rss = 0
+
+    def sample(self) -> int:
+        """Замеряет RSS процесса и учитывает его в пике сборки."""
+        rss = current_rss()
+        self.peak_rss = max(self.peak_rss, rss)
+        return rss
+
+    @property
+    def threshold(self) -> int:
+        return int(self.budget_bytes * self.high_watermark)
+
+    def wait(self, pipeline_idle: Callable[[], bool], stop: threading.Event) -> float:
+        """
+        Приостанавливает вызывающую стадию, пока RSS выше порога.
+
+        Args:
+            pipeline_idle: Функция, возвращающая True, когда очереди стадий пусты.
+            stop: Событие аварийной остановки сборки.
+
+        Returns:
+            Длительность паузы в секундах.
+        """
+        if self.sample() < self.threshold:
+            return 0.0
+
+        start_time = time.perf_counter()
+        while not stop.is_set() and self.sample() >= self.threshold:
+            if pipeline_idle():
+                if self.exceeded:
+                    break
+                # Свободные объекты могли не вернуть память: одна попытка сборки мусора
+                gc.collect()
+                if current_rss() >= self.threshold:
+                    logger.warning(
+                        "RSS %.0f МБ выше порога бюджета %.0f МБ при пустых очередях: "
+                        "документы читаются по одному.",
+                        current_rss() / 1024**2,
+                        self.threshold / 1024**2,
+                    )
+                    self.exceeded = True
+                    break
+                continue
+            time.sleep(0.01)
+        return time.perf_counter() - start_time
+
+
+def put(target: queue.Queue, item: Any, stats: StageStats, stop: threading.Event, nbytes: int = 0) -> bool:
+    """
+    Помещает элемент в ограниченную очередь, ожидая места (обратное давление).
+
+    Args:
+        target: Выходная очередь стадии.
+        item: Элемент (или END).
+        stats: Статистика стадии-производителя.
+        stop: Событие аварийной остановки сборки.
+        nbytes: Объём данных элемента; переходит из обработки стадии в её очередь.
+
+    Returns:
+        False, если сборка остановлена и элемент не помещён.
+    """
+    start_time = time.perf_counter()
+    while not stop.is_set():
+        try:
+            target.put((item, nbytes, stats), timeout=0.1)
+            stats.blocked_seconds += time.perf_counter() - start_time
+            stats.enqueue(nbytes)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def get(source: queue.Queue, stats: StageStats, stop: threading.Event) -> Tuple[Any, int]:
+    """
+    Берёт элемент из очереди в обработку стадии-потребителя.
+
+    Returns:
+        Элемент и его объём в байтах; при остановке сборки — (END, 0).
+    """
+    while not stop.is_set():
+        try:
+            item, nbytes, producer = source.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        producer.dequeue(nbytes)
+        stats.hold(nbytes)
+        return item, nbytes
+    return END, 0
+
+
+def format_stage_report(stages: List[StageStats], budget: MemoryBudget) -> str:
+    """Форматирует отчёт о пиковой памяти стадий, RSS процесса и ожиданиях."""
+    lines = [
+        f"Бюджет RSS: {budget.budget_bytes / 1024**2:.0f} МБ (порог {budget.threshold / 1024**2:.0f} МБ), "
+        f"пик RSS процесса {budget.peak_rss / 1024**2:.1f} МБ."
+    ]
+    for stage in stages:
+        row = stage.as_dict()
+        lines.append(
+            f"  {stage.name:<6} элементов {row['items']:>7} (ошибок {row['failed_items']}), "
+            f"пик данных в обработке {row['peak_held_mb']:>7.1f} МБ, в очереди {row['peak_queued_mb']:>7.1f} МБ, "
+            f"работа {row['busy_seconds']:>7.2f} с, ожидание очереди {row['blocked_seconds']:>7.2f} с, "
+            f"пауза {row['paused_seconds']:>6.2f} с"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+from chromadb.api import Collection
+
+from data_ingestion.config import SHARD_INDEX_DIR
+from utils.logger import setup_logger
+from utils.vector_index import InMemoryIndex, StringWriter, collection_pages, load_strings, unpack_string
+
+# Инициализация логгера
+logger = setup_logger("shards")
+
+
+def shard_index_path(collection_name: str) -> Path:
+    """Возвращает директорию шардов коллекции."""
+    return SHARD_INDEX_DIR / collection_name
+
+
+def shard_of(chunk_id: str, num_shards: int) -> int:
+    """Стабильно сопоставляет чанку номер шарда по хэшу его идентификатора."""
+    digest = hashlib.blake2b(chunk_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % num_shards
+
+
+def shard_paths(collection_name: str) -> List[Path]:
+    """
+    Возвращает директории шардов коллекции.
+
+    Args:
+        collection_name: Имя коллекции ChromaDB.
+
+    Returns:
+        Список директорий шардов (пустой, если коллекция не разбита на шарды).
+    """
+    path = shard_index_path(collection_name)
+    try:
+        with open(path / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return []
+    return [path / f"shard_{i}" for i in range(meta["shards"])]
+
+
+def build_shards_from_pages(
+    pages: Iterator[Tuple[np.ndarray, List[str], List[Optional[dict]], List[str]]],
+    path: Path,
+    num_shards: int,
+) -> List[Path]:
+    """
+    Разбивает поток страниц (эмбеддинги, тексты, метаданные, id) на шарды.
+
+    Чанк попадает в шард по хэшу идентификатора, данные шардов пишутся
+    на диск потоково.
+
+    Args:
+        pages: Итератор страниц данных.
+        path: Директория шардов (перезаписывается).
+        num_shards: Количество шардов.
+
+    Returns:
+        Директории построенных шардов.
+    """
+    start_time = time.perf_counter()
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".building")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+
+    writers = []
+    for i in range(num_shards):
+        shard_path = tmp_path / f"shard_{i}"
+        os.makedirs(shard_path)
+        writers.append(
+            {
+                "vectors": open(shard_path / "vectors.f32", "wb"),
+                "documents": StringWriter(shard_path / "documents"),
+                "metadatas": StringWriter(shard_path / "metadatas"),
+                "ids": StringWriter(shard_path / "ids"),
+                "count": 0,
+            }
+        )
+
+    dim = 0
+    for embeddings, documents, metadatas, ids in pages:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        dim = embeddings.shape[1]
+        assignments = np.fromiter((shard_of(chunk_id, num_shards) for chunk_id in ids), dtype=np.int64, count=len(ids))
+        for i, writer in enumerate(writers):
+            rows = np.flatnonzero(assignments == i)
+            if rows.size == 0:
+                continue
+            embeddings[rows].tofile(writer["vectors"])
+            writer["documents"].extend(documents[j] for j in rows)
+            writer["metadatas"].extend(json.dumps(metadatas[j] or {}, ensure_ascii=False) for j in rows)
+            writer["ids"].extend(ids[j] for j in rows)
+            writer["count"] += int(rows.size)
+
+    for i, writer in enumerate(writers):
+        writer["vectors"].close()
+        for key in ("documents", "metadatas", "ids"):
+            writer[key].close()
+        with open(tmp_path / f"shard_{i}" / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({"count": writer["count"], "dim": dim}, f)
+
+    counts = [writer["count"] for writer in writers]
+    with open(tmp_path / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({"shards": num_shards, "count": sum(counts), "counts": counts, "dim": dim}, f)
+
+    # Замена предыдущей версии шардов
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+    logger.info(
+        f"'{path.name}' разбита на {num_shards} шардов за "
+        f"{time.perf_counter() - start_time:.2f} секунд: {counts}."
+    )
+    return [path / f"shard_{i}" for i in range(num_shards)]
+
+
+def build_shards(collection: Collection, num_shards: int) -> List[Path]:
+    """
+    Разбивает записи коллекции ChromaDB на шарды для отдельных серверов поиска.
+
+    Args:
+        collection: Коллекция ChromaDB.
+        num_shards: Количество шардов.
+
+    Returns:
+        Директории построенных шардов.
+    """
+    return build_shards_from_pages(collection_pages(collection), shard_index_path(collection.name), num_shards)
+
+
+def load_shard(path: Path) -> InMemoryIndex:
+    """
+    Загружает шард, записанный build_shards, в резидентный индекс.
+
+    Args:
+        path: Директория шарда.
+
+    Returns:
+        Объект InMemoryIndex с данными шарда.
+    """
+    path = Path(path)
+    with open(path / "meta.json", "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    count, dim = meta["count"], meta["dim"]
+
+    embeddings = np.fromfile(path / "vectors.f32", dtype=np.float32).reshape(count, dim)
+    documents = load_strings(path / "documents")
+    metadatas = load_strings(path / "metadatas")
+    ids = load_strings(path / "ids")
+    return InMemoryIndex(
+        embeddings,
+        [unpack_string(documents, i) for i in range(count)],
+        [json.loads(unpack_string(metadatas, i)) for i in range(count)],
+        [unpack_string(ids, i) for i in range(count)],
+        name=path.parent.name,
+    )
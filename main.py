@@ -1,6 +1,8 @@
-from fastapi import FastAPI
+import uuid
+
+from fastapi import FastAPI, Request
 from starlette.middleware.cors import CORSMiddleware
-from utils.logger import setup_logger
+from utils.logger import request_id_var, setup_logger
 
 # Инициализация логгера ДО импорта роутера
 logger = setup_logger("letter_pipeline")
@@ -15,4 +17,19 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+
+
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    """Присваивает запросу идентификатор корреляции для всех записей лога."""
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
 app.include_router(router)
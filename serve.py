@@ -0,0 +1,164 @@
+"""
+Многопроцессный запуск API по схеме pre-fork.
+
+Мастер-процесс один раз загружает модель эмбеддингов и резидентные индексы
+баз знаний, открывает слушающий сокет и порождает воркеры через fork.
+Воркеры наследуют модель и индекс по принципу copy-on-write и принимают
+соединения на общем сокете.
+
+Переключение псевдонима базы на новую версию отслеживает только мастер:
+он один раз загружает новую версию (и запускает её серверы шардов), затем
+поочерёдно заменяет воркеры новыми, унаследовавшими её через fork.
+
+Пример запуска:
+    python serve.py --workers 4 --port 8000
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+# Настройки должны быть заданы до импорта приложения
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+from data_ingestion.config import ALIAS_CHECK_INTERVAL, SERVE_WORKERS, TORCH_THREADS_PER_WORKER
+from utils.chroma_client import release_chroma_clients
+from utils.logger import setup_logger
+
+# Инициализация логгера
+logger = setup_logger("serve")
+
+
+def run_worker(app, sock: socket.socket, threads: int) -> None:
+    """
+    Запускает uvicorn в дочернем процессе на унаследованном сокете.
+
+    Args:
+        app: ASGI-приложение.
+        sock: Слушающий сокет, открытый мастером.
+        threads: Количество потоков torch на воркер.
+    """
+    import torch
+    import uvicorn
+
+    # Сброс обработчиков сигналов мастера: uvicorn установит свои
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    # Ограничение потоков, чтобы воркеры не конкурировали за ядра
+    torch.set_num_threads(threads)
+
+    config = uvicorn.Config(app, log_config=None, access_log=False)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pre-fork запуск AI Sales Assistant")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--threads", type=int, default=TORCH_THREADS_PER_WORKER)
+    args = parser.parse_args()
+
+    # Загрузка модели и снимка индекса один раз в мастере
+    start_time = time.perf_counter()
+    from main import app
+    from app.letter_pipeline.nodes import knowledge_registry
+    logger.info(f"Приложение загружено в мастере за {time.perf_counter() - start_time:.2f} секунд.")
+
+    # Воркеры не наследуют клиенты ChromaDB мастера; новые версии
+    # предзагруженных баз загружает мастер и перезапускает воркеры
+    release_chroma_clients()
+    knowledge_registry.master_keys = frozenset(knowledge_registry.resident_keys())
+
+    # Общий слушающий сокет для всех воркеров
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # Заморозка объектов мастера: сборщик мусора в воркерах не будет трогать их страницы
+    gc.collect()
+    gc.freeze()
+
+    children = {}
+    shutting_down = False
+
+    def spawn(slot: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(app, sock, args.threads)
+            finally:
+                os._exit(0)
+        children[pid] = slot
+        logger.info(f"Воркер {slot} запущен (pid {pid}).")
+
+    def rolling_restart() -> None:
+        # Новые воркеры наследуют новую версию базы, старые завершают текущие запросы
+        release_chroma_clients()
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+        for pid, slot in list(children.items()):
+            del children[pid]
+            spawn(slot)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def shutdown(signum, frame) -> None:
+        nonlocal shutting_down
+        shutting_down = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    for slot in range(args.workers):
+        spawn(slot)
+    logger.info(f"🚀 Сервер слушает {args.host}:{args.port}, воркеров: {args.workers}.")
+
+    # Надзор за воркерами: перезапуск упавших до получения сигнала остановки
+    # и замена воркеров после загрузки новой версии базы
+    next_alias_check = time.monotonic() + ALIAS_CHECK_INTERVAL
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        if pid == 0:
+            if not shutting_down and time.monotonic() >= next_alias_check:
+                reloaded = knowledge_registry.refresh_swapped()
+                next_alias_check = time.monotonic() + ALIAS_CHECK_INTERVAL
+                if reloaded and not shutting_down:
+                    logger.info(f"Новые версии баз {reloaded} загружены, перезапуск воркеров.")
+                    rolling_restart()
+            time.sleep(0.2)
+            continue
+        # Заменённые воркеры уже удалены из children
+        slot = children.pop(pid, None)
+        if slot is None:
+            continue
+        if not shutting_down:
+            logger.warning(f"Воркер {slot} (pid {pid}) завершился со статусом {status}, перезапуск.")
+            spawn(slot)
+
+    sock.close()
+    logger.info("Сервер остановлен.")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,34 @@
 import os
+from typing import Optional
+
 import chromadb
 from chromadb import Settings
 from chromadb.api import Collection
 
 from data_ingestion.config import CHROMA_DB_PATH, CHROMA_COLLECTION_NAME
 
+def collection_name_for(knowledge_base_id: Optional[str] = None) -> str:
+    """Возвращает имя коллекции ChromaDB для базы знаний (None — основная база)."""
+    if not knowledge_base_id:
+        return CHROMA_COLLECTION_NAME
+    return f"{CHROMA_COLLECTION_NAME}__{knowledge_base_id}"
+
 def get_chroma_client() -> chromadb.ClientAPI:
     os.makedirs(CHROMA_DB_PATH, exist_ok=True)  # создаёт, если не существует
     return chromadb.PersistentClient(path=CHROMA_DB_PATH)
 
-def get_chroma_collection(client: chromadb.ClientAPI) -> Collection:
+def release_chroma_clients() -> None:
+    """Закрывает кэшированные клиенты ChromaDB (перед fork воркеров)."""
+    from chromadb.api.client import SharedSystemClient
+
+    SharedSystemClient.clear_system_cache()
+
+def get_chroma_collection(client: chromadb.ClientAPI, name: str = CHROMA_COLLECTION_NAME) -> Collection:
     """Инициализирует и возвращает коллекцию ChromaDB.
 
     Args:
         client: Клиент Chroma DB
+        name: Имя коллекции.
     Raises:
         RuntimeError: Если не удалось инициализировать коллекцию ChromaDB.
 
@@ -21,7 +36,7 @@ def get_chroma_collection(client: chromadb.ClientAPI) -> Collection:
         Коллекция ChromaDB для работы с данными.
     """
     try:
-        return client.get_or_create_collection(name=CHROMA_COLLECTION_NAME)
+        return client.get_or_create_collection(name=name)
     except Exception as e:
         raise RuntimeError(
             f"Ошибка инициализации коллекции ChromaDB: {str(e)}"
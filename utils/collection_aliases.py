@@ -0,0 +1,142 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from data_ingestion.config import ALIAS_CHECK_INTERVAL, CHROMA_DB_PATH
+
+# Файл псевдонимов: логическое имя базы → версионированная коллекция
+ALIASES_PATH = CHROMA_DB_PATH / "aliases.json"
+# Блокировка изменения псевдонимов между процессами (сборка, откат, пересборка в сервисе)
+ALIASES_LOCK_PATH = CHROMA_DB_PATH / "aliases.lock"
+
+_cache: Dict[str, dict] = {}
+_cache_mtime = -1
+_cache_checked = 0.0
+_lock = threading.Lock()
+
+
+def _read() -> Dict[str, dict]:
+    """Читает файл псевдонимов (с проверкой изменений не чаще ALIAS_CHECK_INTERVAL)."""
+    global _cache, _cache_mtime, _cache_checked
+    now = time.monotonic()
+    if now - _cache_checked < ALIAS_CHECK_INTERVAL:
+        return _cache
+
+    with _lock:
+        _cache_checked = now
+        try:
+            mtime = os.stat(ALIASES_PATH).st_mtime_ns
+        except FileNotFoundError:
+            _cache, _cache_mtime = {}, -1
+            return _cache
+        if mtime != _cache_mtime:
+            with open(ALIASES_PATH, "r", encoding="utf-8") as f:
+                _cache = json.load(f)
+            _cache_mtime = mtime
+    return _cache
+
+
+def _write(aliases: Dict[str, dict]) -> None:
+    """Атомарно записывает файл псевдонимов и сбрасывает кэш чтения."""
+    global _cache_checked
+    os.makedirs(CHROMA_DB_PATH, exist_ok=True)
+    tmp_path = ALIASES_PATH.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(aliases, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, ALIASES_PATH)
+    _cache_checked = 0.0
+
+
+@contextmanager
+def _update_lock():
+    """Блокировка чтения-изменения-записи файла псевдонимов (в процессе и между процессами)."""
+    os.makedirs(CHROMA_DB_PATH, exist_ok=True)
+    with _lock, open(ALIASES_LOCK_PATH, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def resolve_alias(alias: str) -> str:
+    """
+    Возвращает имя коллекции, на которую указывает псевдоним.
+
+    Args:
+        alias: Логическое имя базы знаний.
+
+    Returns:
+        Имя текущей версии коллекции или сам псевдоним, если он не задан.
+    """
+    entry = _read().get(alias)
+    return entry["current"] if entry else alias
+
+
+def alias_versions(alias: str) -> List[str]:
+    """Возвращает версии базы: текущую и сохранённые для отката (от новых к старым)."""
+    entry = _read().get(alias)
+    return [entry["current"], *entry["previous"]] if entry else []
+
+
+def swap_alias(alias: str, collection_name: str, keep: int, previous: Optional[str] = None) -> List[str]:
+    """
+    Атомарно переключает псевдоним на новую версию коллекции.
+
+    Args:
+        alias: Логическое имя базы знаний.
+        collection_name: Имя новой версии коллекции.
+        keep: Сколько версий хранить вместе с текущей (для отката).
+        previous: Текущая версия, если псевдоним ещё не задан (коллекция без версии).
+
+    Returns:
+        Имена версий, вышедших за пределы хранения (их можно удалить).
+    """
+    with _update_lock():
+        aliases = _read_fresh()
+        entry = aliases.get(alias)
+        history = [entry["current"], *entry["previous"]] if entry else ([previous] if previous else [])
+        history = [name for name in history if name != collection_name]
+        retained, dropped = history[: max(keep - 1, 0)], history[max(keep - 1, 0) :]
+        aliases[alias] = {"current": collection_name, "previous": retained, "updated_at": time.time()}
+        _write(aliases)
+    return dropped
+
+
+def rollback_alias(alias: str) -> str:
+    """
+    Возвращает псевдоним на предыдущую сохранённую версию.
+
+    Args:
+        alias: Логическое имя базы знаний.
+
+    Returns:
+        Имя версии, ставшей текущей.
+
+    Raises:
+        ValueError: Если предыдущей версии нет.
+    """
+    with _update_lock():
+        aliases = _read_fresh()
+        entry = aliases.get(alias)
+        if not entry or not entry["previous"]:
+            raise ValueError(f"Для '{alias}' нет предыдущей версии.")
+        current, *previous = entry["previous"]
+        aliases[alias] = {"current": current, "previous": [*previous, entry["current"]], "updated_at": time.time()}
+        _write(aliases)
+    return current
+
+
+def _read_fresh() -> Dict[str, dict]:
+    """Читает файл псевдонимов в обход кэша."""
+    try:
+        with open(ALIASES_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
@@ -1,5 +1,164 @@
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
 import sys
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import psutil
+
+from data_ingestion.config import LOG_ASYNC, LOG_FORMAT, LOG_LEVEL, LOG_QUEUE_SIZE, LOG_SAMPLE_RATES
+
+# Идентификатор текущего запроса (корреляция записей одного запроса)
+request_id_var: contextvars.ContextVar = contextvars.ContextVar("request_id", default="-")
+
+
+class _LazyRSS:
+    """Текущий RSS процесса в МБ, вычисляемый только при форматировании записи."""
+
+    def __str__(self) -> str:
+        return f"{psutil.Process().memory_info().rss / 1024**2:.2f}"
+
+
+# Аргумент для записей о потреблении памяти: logger.info("... %s МБ", RSS_MB)
+RSS_MB = _LazyRSS()
+
+
+def _parse_sample_rates(value: str) -> Dict[str, float]:
+    """Разбирает строку вида "name=rate,name=rate" в словарь."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+class RequestIdFilter(logging.Filter):
+    """Добавляет в запись идентификатор текущего запроса."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю записей ниже уровня WARNING.
+
+    Предупреждения и ошибки не сэмплируются никогда.
+    """
+
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись как одну строку JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler с ограниченной очередью, не блокирующий вызывающий код.
+
+    Форматирование сообщения откладывается до фонового потока, поэтому
+    аргументы записи должны быть неизменяемыми (строки, числа). При
+    переполнении очереди запись отбрасывается и учитывается в dropped.
+    """
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Трассировка исключения сериализуется сразу: объект traceback не переживёт кадр
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _make_formatter() -> logging.Formatter:
+    if LOG_FORMAT == "json":
+        return JsonFormatter()
+    return logging.Formatter(
+        "[%(asctime)s] [%(name)s] [%(levelname)s] [%(request_id)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+
+
+_request_id_filter = RequestIdFilter()
+_sample_rates = _parse_sample_rates(LOG_SAMPLE_RATES)
+_queue_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_listener_lock = threading.Lock()
+
+
+def _start_listener() -> None:
+    """Создаёт очередь и фоновый поток, пишущий записи в stdout."""
+    global _listener
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _queue_handler.queue = log_queue
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(_make_formatter())
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+
+
+def _get_queue_handler() -> DroppingQueueHandler:
+    """Возвращает общий для всех логгеров QueueHandler, запуская фоновый поток."""
+    global _queue_handler
+    with _listener_lock:
+        if _queue_handler is None:
+            _queue_handler = DroppingQueueHandler(queue.Queue())
+            _queue_handler.addFilter(_request_id_filter)
+            _start_listener()
+            atexit.register(stop_logging)
+            # Потоки не переживают fork: в дочернем процессе поток запускается заново
+            os.register_at_fork(after_in_child=_start_listener)
+    return _queue_handler
+
+
+def stop_logging() -> None:
+    """Останавливает фоновый поток, дописывая накопленные записи."""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def dropped_log_records() -> int:
+    """Количество записей, отброшенных из-за переполнения очереди."""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
 
 def setup_logger(name: str) -> logging.Logger:
     """Настраивает и возвращает логгер с заданным именем.
@@ -11,15 +170,19 @@ def setup_logger(name: str) -> logging.Logger:
         Настроенный объект логгера.
     """
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
+    logger.setLevel(LOG_LEVEL)
 
     if not logger.handlers:
-        handler = logging.StreamHandler(sys.stdout)
-        formatter = logging.Formatter(
-            "[%(asctime)s] [%(name)s] [%(levelname)s] %(message)s",
-            datefmt="%Y-%m-%d %H:%M:%S",
-        )
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-
-    return logger
\ No newline at end of file
+        if LOG_ASYNC:
+            logger.addHandler(_get_queue_handler())
+        else:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(_make_formatter())
+            handler.addFilter(_request_id_filter)
+            logger.addHandler(handler)
+
+        # Сэмплирование частых записей для выбранных логгеров
+        if name in _sample_rates:
+            logger.addFilter(SamplingFilter(_sample_rates[name]))
+
+    return logger
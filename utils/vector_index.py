@@ -0,0 +1,188 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+from chromadb.api import Collection
+
+from utils.logger import setup_logger
+
+# Инициализация логгера
+logger = setup_logger("vector_index")
+
+
+def pack_strings(values: Sequence[str]) -> tuple:
+    """
+    Упаковывает строки в один UTF-8 буфер и массив смещений.
+
+    Такой формат не содержит Python-объектов на строку, поэтому после fork
+    его страницы не копируются из-за изменения счётчиков ссылок.
+    """
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8) if encoded else np.zeros(0, np.uint8)
+    return blob, offsets
+
+
+def unpack_string(packed: tuple, i: int) -> str:
+    """Возвращает i-ю строку из буфера, упакованного pack_strings."""
+    blob, offsets = packed
+    return blob[offsets[i] : offsets[i + 1]].tobytes().decode("utf-8")
+
+
+class StringWriter:
+    """Потоково записывает строки в бинарный файл и сохраняет массив смещений."""
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._file = open(path.with_suffix(".bin"), "wb")
+        self._offsets = [0]
+
+    def extend(self, values: Iterable[str]) -> None:
+        for value in values:
+            data = value.encode("utf-8")
+            self._file.write(data)
+            self._offsets.append(self._offsets[-1] + len(data))
+
+    def close(self) -> None:
+        self._file.close()
+        np.save(self._path.with_suffix(".idx.npy"), np.asarray(self._offsets, dtype=np.int64))
+
+
+def load_strings(path: Path) -> tuple:
+    """Открывает строки, записанные StringWriter, через memory-map."""
+    offsets = np.load(path.with_suffix(".idx.npy"))
+    blob_path = path.with_suffix(".bin")
+    if os.path.getsize(blob_path) == 0:
+        return np.zeros(0, dtype=np.uint8), offsets
+    return np.memmap(blob_path, dtype=np.uint8, mode="r"), offsets
+
+
+def collection_pages(collection: Collection, page_size: int = 5000) -> Iterator[tuple]:
+    """Постранично читает эмбеддинги, тексты и метаданные коллекции ChromaDB."""
+    total = collection.count()
+    for offset in range(0, total, page_size):
+        page = collection.get(
+            include=["embeddings", "documents", "metadatas"],
+            limit=page_size,
+            offset=offset,
+        )
+        yield page["embeddings"], page["documents"], page["metadatas"], page["ids"]
+
+
+class InMemoryIndex:
+    """
+    Неизменяемый снимок коллекции ChromaDB в памяти процесса.
+
+    Повторяет интерфейс коллекции, используемый при поиске (count, query),
+    и хранит данные только в массивах numpy. Снимок загружается в мастер-процессе
+    до fork и разделяется воркерами по принципу copy-on-write.
+
+    Attributes:
+        embeddings: Матрица эмбеддингов float32 формы (N, dim).
+        name: Имя коллекции, с которой снят индекс.
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        documents: Sequence[str],
+        metadatas: Optional[Sequence[Optional[dict]]] = None,
+        ids: Optional[Sequence[str]] = None,
+        name: Optional[str] = None,
+    ) -> None:
+        """
+        Создаёт индекс из эмбеддингов и текстов чанков.
+
+        Args:
+            embeddings: Эмбеддинги чанков.
+            documents: Тексты чанков.
+            metadatas: Метаданные чанков.
+            ids: Идентификаторы чанков.
+            name: Имя коллекции-источника.
+        """
+        self.name = name
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self._sq_norms = np.einsum("ij,ij->i", self.embeddings, self.embeddings)
+
+        count = len(documents)
+        self._docs = pack_strings(documents)
+        self._metas = pack_strings([json.dumps(m or {}, ensure_ascii=False) for m in metadatas or [None] * count])
+        self._ids = pack_strings(ids or [f"doc_{i}" for i in range(count)])
+
+        # Запрет записи в массивы: индекс разделяется между процессами
+        for array in (self.embeddings, self._sq_norms, *self._docs, *self._metas, *self._ids):
+            array.setflags(write=False)
+
+    @classmethod
+    def from_collection(cls, collection: Collection, page_size: int = 5000) -> "InMemoryIndex":
+        """
+        Загружает все записи коллекции ChromaDB постранично.
+
+        Args:
+            collection: Коллекция ChromaDB.
+            page_size: Количество записей на одну выборку.
+
+        Returns:
+            Объект InMemoryIndex.
+        """
+        embeddings, documents, metadatas, ids = [], [], [], []
+        total = collection.count()
+        for offset in range(0, total, page_size):
+            page = collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=page_size,
+                offset=offset,
+            )
+            embeddings.append(np.asarray(page["embeddings"], dtype=np.float32))
+            documents.extend(page["documents"])
+            metadatas.extend(page["metadatas"])
+            ids.extend(page["ids"])
+
+        matrix = np.concatenate(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+        index = cls(matrix, documents, metadatas, ids, name=collection.name)
+        logger.info(f"Снимок коллекции '{collection.name}' загружен: {index.count()} чанков, {index.nbytes / 1024**2:.2f} МБ.")
+        return index
+
+    def count(self) -> int:
+        """Возвращает количество чанков в индексе."""
+        return int(self.embeddings.shape[0])
+
+    @property
+    def nbytes(self) -> int:
+        """Объём памяти, занимаемый индексом, в байтах."""
+        arrays = (self.embeddings, self._sq_norms, *self._docs, *self._metas, *self._ids)
+        return int(sum(array.nbytes for array in arrays))
+
+    def query(self, query_embeddings: Sequence, n_results: int = 10, **_) -> Dict[str, List[list]]:
+        """
+        Точный поиск ближайших соседей по квадрату L2-расстояния (как в ChromaDB).
+
+        Args:
+            query_embeddings: Список эмбеддингов запросов.
+            n_results: Количество результатов на запрос.
+
+        Returns:
+            Словарь в формате ответа collection.query (ids, documents, metadatas, distances).
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        k = min(n_results, self.count())
+
+        for query in queries:
+            if k == 0:
+                top, distances = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+            else:
+                distances = self._sq_norms - 2.0 * (self.embeddings @ query) + float(query @ query)
+                top = np.argpartition(distances, k - 1)[:k]
+                top = top[np.argsort(distances[top])]
+                distances = distances[top]
+
+            result["ids"].append([unpack_string(self._ids, i) for i in top])
+            result["documents"].append([unpack_string(self._docs, i) for i in top])
+            result["metadatas"].append([json.loads(unpack_string(self._metas, i)) for i in top])
+            result["distances"].append(distances.tolist())
+
+        return result